@@ -3,22 +3,97 @@ The PDFinator - A comprehensive PDF manipulation tool
 Supports splitting, merging, page operations, text extraction, and decryption
 """
 
+import io
 import os
+import re
 import sys
+import csv
+import json
+import time
+import zlib
+import shutil
+import hashlib
+import sqlite3
+import tempfile
+import functools
+import threading
+import pstats
+import inspect
+import cProfile
+import argparse
+import tracemalloc
+import multiprocessing
+import http.server
+import urllib.request
 from datetime import datetime
+from concurrent.futures import ProcessPoolExecutor
 import logging
+from logging.handlers import RotatingFileHandler
 
 # Setup early logging to catch startup errors
 LOGS_DIR = "./logs"
+LOG_MAX_BYTES = 10 * 1024 * 1024  # rotate a process's log once it reaches 10 MB
+LOG_BACKUP_COUNT = 3              # rotated files kept per process
+LOG_RETENTION = 50                # newest log files kept in LOGS_DIR, older ones are deleted
+
+def is_worker_process():
+    """Return True inside a worker process started by a process pool"""
+    return __name__ == "__mp_main__" or multiprocessing.parent_process() is not None
+
+def create_log_handler():
+    """Return a size-capped, rotating file handler for this process's log file"""
+    # The PID keeps parallel workers started in the same second from sharing a file
+    kind = "worker" if is_worker_process() else "processing"
+    log_filename = datetime.now().strftime(f"pdf_{kind}_%Y-%m-%d_%H-%M-%S_{os.getpid()}.log")
+    log_path = os.path.join(LOGS_DIR, log_filename)
+    return RotatingFileHandler(log_path, maxBytes=LOG_MAX_BYTES, backupCount=LOG_BACKUP_COUNT, encoding="utf-8")
+
+def init_worker_logging():
+    """Pool initializer: replace a log file handler inherited through fork with this worker's own"""
+    root = logging.getLogger()
+    for handler in list(root.handlers):
+        # Spawned workers re-import this module and already log to a file named for their PID
+        if isinstance(handler, RotatingFileHandler) and not handler.baseFilename.endswith(f"_{os.getpid()}.log"):
+            # Not closed: the stream is shared with the parent, which keeps writing to it
+            root.removeHandler(handler)
+            worker_handler = create_log_handler()
+            worker_handler.setFormatter(handler.formatter)
+            root.addHandler(worker_handler)
+
+def log_modified_time(path):
+    """Return a log file's modification time, or 0 if another process already deleted it"""
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0
+
+def prune_old_logs():
+    """Delete all but the newest LOG_RETENTION session logs, and worker logs older than those"""
+    session_logs, worker_logs = [], []
+    for f in os.listdir(LOGS_DIR):
+        if f.startswith("pdf_processing_"):
+            session_logs.append(os.path.join(LOGS_DIR, f))
+        elif f.startswith("pdf_worker_"):
+            worker_logs.append(os.path.join(LOGS_DIR, f))
+    
+    # Worker logs never count towards retention, so a busy pool cannot push out session logs
+    modified = {path: log_modified_time(path) for path in session_logs + worker_logs}
+    session_logs.sort(key=modified.get, reverse=True)
+    oldest_kept = modified[session_logs[LOG_RETENTION - 1]] if len(session_logs) > LOG_RETENTION else 0
+    
+    for path in session_logs[LOG_RETENTION:] + [log for log in worker_logs if modified[log] < oldest_kept]:
+        try:
+            os.remove(path)
+        except OSError:
+            pass  # Another process may have removed or still hold it
+
 os.makedirs(LOGS_DIR, exist_ok=True)
-log_filename = datetime.now().strftime("pdf_processing_%Y-%m-%d_%H-%M-%S.log")
-log_path = os.path.join(LOGS_DIR, log_filename)
 
 logging.basicConfig(
     level=logging.INFO,
     format="%(asctime)s - %(levelname)s - %(message)s",
     handlers=[
-        logging.FileHandler(log_path, encoding="utf-8"),
+        create_log_handler(),
         logging.StreamHandler(sys.stderr)
     ]
 )
@@ -52,6 +127,19 @@ except Exception as e:
     raise
 
 INPUT_DIR = "./pdfs"
+RUNS_DIR = os.path.join(INPUT_DIR, "runs")
+RUN_DIR_ENV = "PDFINATOR_RUN_DIR"  # "auto" for a fresh run directory, or an explicit path
+PROFILE_ENV = "PDFINATOR_PROFILE"  # set to 1 to profile every operation
+PROFILES_DIR = os.path.join(LOGS_DIR, "profiles")
+PROFILE_TOP_ALLOCATIONS = 15
+_run_output_dir = None
+_UMASK = os.umask(0)  # read once at import; os.umask can only be queried by setting it
+os.umask(_UMASK)
+_profiling_enabled = os.environ.get(PROFILE_ENV, "").lower() in ("1", "true", "yes")
+_profiling_active = False
+_profiling_operation = None  # name of the operation being profiled, used to tag worker profiles
+_profiling_dispatched = False  # set once the profiled operation hands jobs to worker processes
+JOURNAL_PATH = os.path.join(LOGS_DIR, "job_journal.sqlite3")
 
 # Test pycryptodome availability
 try:
@@ -61,69 +149,357 @@ except ImportError:
     logger.warning("PyCryptodome not available - some encrypted PDFs may not work")
     CRYPTO_AVAILABLE = False
 
+# Test NumPy availability (needed for structured text extraction and duplicate detection)
+try:
+    import numpy as np
+    NUMPY_AVAILABLE = True
+except ImportError:
+    logger.warning("NumPy not available - structured text extraction and duplicate detection are disabled")
+    NUMPY_AVAILABLE = False
+
+# Test Pillow availability (only needed for WebP export)
+try:
+    from PIL import Image
+    PIL_AVAILABLE = True
+except ImportError:
+    logger.warning("Pillow not available - WebP image export is disabled")
+    PIL_AVAILABLE = False
+
+# Test pikepdf availability (only needed for linearization)
+try:
+    import pikepdf
+    PIKEPDF_AVAILABLE = True
+except ImportError:
+    logger.warning("pikepdf not available - PDF linearization is disabled")
+    PIKEPDF_AVAILABLE = False
+
 # Setup directories and logging
 def setup_environment():
     """Initialize directories and logging configuration"""
     for directory in [INPUT_DIR, LOGS_DIR]:
         os.makedirs(directory, exist_ok=True)
     
-    log_filename = datetime.now().strftime("pdf_processing_%Y-%m-%d_%H-%M-%S.log")
-    log_path = os.path.join(LOGS_DIR, log_filename)
-    
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(levelname)s - %(message)s",
-        handlers=[
-            logging.FileHandler(log_path, encoding="utf-8"),
-            logging.StreamHandler()
-        ]
-    )
+    # Logging itself is configured at import time; only tidy up old files here. Workers
+    # re-import this module, so leave pruning to the main process to avoid racing it.
+    if not is_worker_process():
+        prune_old_logs()
     
-    if not CRYPTO_AVAILABLE:
-        logging.warning("PyCryptodome not available - some encrypted PDFs may not work")
+    if os.environ.get(RUN_DIR_ENV):
+        start_run(os.environ[RUN_DIR_ENV])
     
     return logging.getLogger(__name__)
 
-logger = setup_environment()
-
 # Utility Functions
+def start_run(run_dir="auto"):
+    """Send all outputs of this process (and its workers) to a run-scoped directory"""
+    global _run_output_dir
+    if run_dir == "auto":
+        stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        for attempt in range(1, 1000):
+            run_dir = os.path.join(RUNS_DIR, f"run_{stamp}_{os.getpid()}" + (f"_{attempt}" if attempt > 1 else ""))
+            try:
+                os.makedirs(run_dir)
+                break
+            except FileExistsError:
+                continue
+    else:
+        os.makedirs(run_dir, exist_ok=True)
+    
+    _run_output_dir = run_dir
+    # Child processes inherit the concrete path rather than starting runs of their own
+    os.environ[RUN_DIR_ENV] = run_dir
+    logger.info(f"Run output directory: {run_dir}")
+    return run_dir
+
+def end_run():
+    """Return to writing outputs into the main pdfs directory"""
+    global _run_output_dir
+    _run_output_dir = None
+    os.environ.pop(RUN_DIR_ENV, None)
+
 def get_output_subdir(pdf_path):
     """Create and return output subdirectory for a PDF file"""
     base_name = os.path.splitext(os.path.basename(pdf_path))[0]
-    subdir = os.path.join(INPUT_DIR, base_name)
+    subdir = os.path.join(get_single_output_dir(), base_name)
     os.makedirs(subdir, exist_ok=True)
     return subdir
 
 def get_single_output_dir():
-    """Return the main pdfs directory for single file outputs"""
-    return INPUT_DIR
+    """Return the directory for single file outputs (the active run's directory, if any)"""
+    return _run_output_dir or INPUT_DIR
 
 def get_base_name(file_path):
     """Extract base filename without extension"""
     return os.path.splitext(os.path.basename(file_path))[0]
 
+def get_worker_count(workers=None):
+    """Return the number of worker processes to use for parallel operations"""
+    if workers is None or workers < 1:
+        return os.cpu_count() or 1
+    return workers
+
+def split_into_chunks(items, chunk_count):
+    """Split a list into at most chunk_count contiguous, non-empty chunks"""
+    chunk_count = max(1, min(chunk_count, len(items)))
+    size, remainder = divmod(len(items), chunk_count)
+    chunks, start = [], 0
+    for i in range(chunk_count):
+        end = start + size + (1 if i < remainder else 0)
+        chunks.append(items[start:end])
+        start = end
+    return [chunk for chunk in chunks if chunk]
+
+def run_in_workers(worker_func, jobs, workers):
+    """Run worker_func over a list of argument tuples, using a process pool when worthwhile"""
+    if workers <= 1 or len(jobs) <= 1:
+        return [worker_func(*job) for job in jobs]
+    
+    global _profiling_dispatched
+    with ProcessPoolExecutor(max_workers=min(workers, len(jobs)), initializer=init_worker_logging) as executor:
+        # The parent's profile only shows it waiting, so profile each job where it runs
+        if _profiling_active:
+            _profiling_dispatched = True
+            futures = [executor.submit(_run_profiled_worker, _profiling_operation, worker_func, *job) for job in jobs]
+        else:
+            futures = [executor.submit(worker_func, *job) for job in jobs]
+        return [future.result() for future in futures]
+
+def _link_unique(temp_path, output_path):
+    """Link a finished file to a free output name, adding " (2)", " (3)", ... if the name is taken"""
+    root, extension = os.path.splitext(output_path)
+    candidate, number = output_path, 1
+    while True:
+        try:
+            # link fails if the name exists, so parallel workers can never claim the same name
+            os.link(temp_path, candidate)
+            return candidate
+        except FileExistsError:
+            number += 1
+            candidate = f"{root} ({number}){extension}"
+
+class AtomicOutput:
+    """Context manager yielding a temp path that is moved to the output path on success"""
+    
+    def __init__(self, output_path, unique=False):
+        self.path = output_path
+        self.unique = unique
+        self.temp_path = None
+    
+    def __enter__(self):
+        output_dir = os.path.dirname(self.path) or "."
+        suffix = os.path.splitext(self.path)[1]
+        fd, self.temp_path = tempfile.mkstemp(dir=output_dir, prefix=".tmp-", suffix=suffix)
+        os.close(fd)
+        return self.temp_path
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if exc_type is None:
+                # mkstemp creates the file as 0600; give outputs the permissions a plain open() would
+                os.chmod(self.temp_path, 0o666 & ~_UMASK)
+                if self.unique:
+                    # The name is only claimed once the file is complete, so a crash leaves nothing behind
+                    self.path = _link_unique(self.temp_path, self.path)
+                else:
+                    os.replace(self.temp_path, self.path)
+        finally:
+            if os.path.exists(self.temp_path):
+                os.remove(self.temp_path)
+        return False
+
+def atomic_output(output_path, unique=False):
+    """Write through a temp file; with unique=True a taken name gets a " (n)" suffix, read .path after"""
+    return AtomicOutput(output_path, unique)
+
+@functools.lru_cache(maxsize=4096)
+def _hash_file_contents(path, size, mtime_ns):
+    """Return the SHA-256 of a file (cached per size/mtime so unchanged files hash once)"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def file_hash(path):
+    """Return the SHA-256 hex digest of a file's contents"""
+    stat = os.stat(path)
+    return _hash_file_contents(os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+
+def enable_profiling():
+    """Profile every operation from now on, including the jobs it hands to worker processes"""
+    global _profiling_enabled
+    _profiling_enabled = True
+    os.environ[PROFILE_ENV] = "1"
+
+def _describe_inputs(args):
+    """Return (paths, total bytes, total pages) for the PDF inputs among an operation's arguments"""
+    candidates = args[0] if args and isinstance(args[0], (list, tuple)) else args[:2]
+    paths = [a for a in candidates if isinstance(a, str) and a.lower().endswith(".pdf") and os.path.isfile(a)]
+    total_bytes = total_pages = 0
+    for path in paths:
+        total_bytes += os.path.getsize(path)
+        try:
+            doc = fitz.open(path)
+            total_pages += doc.page_count
+            doc.close()
+        except Exception:
+            pass  # Unreadable inputs still get timed, just without a page count
+    return paths, total_bytes, total_pages
+
+def _describe_job(worker_func, args):
+    """Return (paths, total bytes, pages processed) for one worker job, counting only its own pages"""
+    job = inspect.signature(worker_func).bind(*args).arguments
+    if "file_jobs" in job:
+        return _describe_inputs(([input_file for input_file, *_ in job["file_jobs"]],))
+    
+    paths, total_bytes, total_pages = _describe_inputs(args)
+    # Page-range workers get part of a file; count the pages they were handed, not the whole file
+    if "page_numbers" in job:
+        total_pages = len(job["page_numbers"])
+    elif "image_jobs" in job:
+        total_pages = len({page_number for _, page_number, _ in job["image_jobs"]})
+    return paths, total_bytes, total_pages
+
+def profile_operation(operation_func, name=None, describe=_describe_inputs):
+    """Decorator that captures cProfile and tracemalloc data when profiling is enabled"""
+    name = name or operation_func.__name__
+    
+    @functools.wraps(operation_func)
+    def wrapper(*args, **kwargs):
+        global _profiling_active, _profiling_operation, _profiling_dispatched
+        # Nested operations run inside the outer profile rather than starting their own
+        if not _profiling_enabled or _profiling_active:
+            return operation_func(*args, **kwargs)
+        
+        _profiling_active, _profiling_operation, _profiling_dispatched = True, name, False
+        profiler = cProfile.Profile()
+        tracemalloc.start()
+        start = time.perf_counter()
+        result = None
+        try:
+            result = profiler.runcall(operation_func, *args, **kwargs)
+            return result
+        finally:
+            elapsed = time.perf_counter() - start
+            snapshot = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            _profiling_active, _profiling_operation = False, None
+            _save_profile(name, describe(args), profiler, snapshot, peak, elapsed, result, _profiling_dispatched)
+    return wrapper
+
+def _run_profiled_worker(operation_name, worker_func, *args):
+    """Worker: run one job under its own profile, tagged with the operation that started it"""
+    global _profiling_enabled, _profiling_active
+    # A forked worker inherits the parent's tracing state; start from a clean slate
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    _profiling_enabled, _profiling_active = True, False
+    return profile_operation(worker_func, f"{operation_name}.{worker_func.__name__}",
+                             functools.partial(_describe_job, worker_func))(*args)
+
+def _save_profile(operation_name, inputs, profiler, snapshot, peak, elapsed, result, dispatched):
+    """Write a .prof file and a JSON summary (timing, memory, top allocations) for one operation"""
+    try:
+        os.makedirs(PROFILES_DIR, exist_ok=True)
+        paths, input_bytes, page_count = inputs
+        label = get_base_name(paths[0]) if paths else "no-input"
+        stamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S")
+        base_path = os.path.join(PROFILES_DIR, f"{operation_name}_{label}_{stamp}_{os.getpid()}")
+        # A worker can finish several jobs within the same second
+        suffix = 1
+        while os.path.exists(f"{base_path}.prof" if suffix == 1 else f"{base_path}_{suffix}.prof"):
+            suffix += 1
+        if suffix > 1:
+            base_path = f"{base_path}_{suffix}"
+        
+        profiler.dump_stats(f"{base_path}.prof")
+        allocations = [
+            {"location": f"{stat.traceback[0].filename}:{stat.traceback[0].lineno}",
+             "size_kb": round(stat.size / 1024, 1), "count": stat.count}
+            for stat in snapshot.statistics("lineno")[:PROFILE_TOP_ALLOCATIONS]
+        ]
+        summary = {
+            "operation": operation_name,
+            "inputs": paths,
+            "input_bytes": input_bytes,
+            "page_count": page_count,
+            "elapsed_seconds": round(elapsed, 4),
+            "peak_memory_kb": round(peak / 1024, 1),
+            "succeeded": bool(result),
+            # The parent's profile of a pooled operation only shows it waiting on the workers
+            "dispatched_workers": dispatched,
+            "profile": f"{base_path}.prof",
+            "top_allocations": allocations,
+        }
+        with open(f"{base_path}.json", "w", encoding="utf-8") as f:
+            json.dump(summary, f, indent=2)
+        logger.info(f"Profile saved: {os.path.basename(base_path)} ({elapsed:.2f}s, peak {peak / 1024:.0f} KB)")
+    except Exception as e:
+        logger.warning(f"Failed to save profile for {operation_name}: {e}")
+
+def profile_report(profiles_dir=PROFILES_DIR, top=10):
+    """Summarize saved profiles: the slowest inputs and the hottest call sites across all runs"""
+    summaries = []
+    for name in sorted(os.listdir(profiles_dir)) if os.path.isdir(profiles_dir) else []:
+        if name.endswith(".json"):
+            with open(os.path.join(profiles_dir, name), encoding="utf-8") as f:
+                summaries.append(json.load(f))
+    
+    if not summaries:
+        return f"No profiles found in {profiles_dir}"
+    
+    lines = [f"Slowest operations ({len(summaries)} profiled):"]
+    for summary in sorted(summaries, key=lambda s: s["elapsed_seconds"], reverse=True)[:top]:
+        inputs = ", ".join(os.path.basename(path) for path in summary["inputs"]) or "-"
+        waited = " [waited on workers]" if summary.get("dispatched_workers") else ""
+        lines.append(f"  {summary['elapsed_seconds']:8.2f}s  {summary['peak_memory_kb'] / 1024:7.1f} MB  "
+                     f"{summary['page_count']:6d} pages  {summary['input_bytes'] / 1024:9.0f} KB  "
+                     f"{summary['operation']}({inputs}){waited}")
+    
+    # Dispatching parents would only add their wait to the totals; their workers' profiles hold the work
+    profile_files = [s["profile"] for s in summaries
+                     if not s.get("dispatched_workers") and os.path.exists(s["profile"])]
+    if profile_files:
+        stream = io.StringIO()
+        stats = pstats.Stats(*profile_files, stream=stream)
+        stats.sort_stats("tottime").print_stats(top)
+        lines.append("")
+        lines.append("Hottest call sites (all profiles combined):")
+        lines.append(stream.getvalue().strip())
+    
+    return "\n".join(lines)
+
 def safe_file_operation(operation_func):
     """Decorator for safe file operations with error handling"""
+    @functools.wraps(operation_func)
     def wrapper(*args, **kwargs):
         try:
             return operation_func(*args, **kwargs)
         except Exception as e:
             logger.error(f"Error in {operation_func.__name__}: {e}", exc_info=True)
             return False
-    return wrapper
+    return profile_operation(wrapper)
+
+logger = setup_environment()
 
 # PDF Processing Functions
 @safe_file_operation
-def merge_pdfs(input1, input2, output_file=None):
+def merge_pdfs(input1, input2, output_file=None, preserve_structure=False):
     """Merge two PDF files"""
     logger.info(f"Merging: {os.path.basename(input1)} + {os.path.basename(input2)}")
     
     # Single output file - save to main pdfs directory
     output_dir = get_single_output_dir()
-    if output_file is None:
+    # A default name never replaces an earlier output, it gets a " (n)" suffix instead
+    unique = output_file is None
+    if unique:
         name1, name2 = get_base_name(input1), get_base_name(input2)
         output_file = os.path.join(output_dir, f"({name1})+({name2}).pdf")
 
+    if preserve_structure:
+        return _merge_with_structure([input1, input2], output_file, unique)
+
     merger = PyPDF2.PdfMerger()
     for pdf in [input1, input2]:
         if os.path.exists(pdf):
@@ -132,24 +508,33 @@ def merge_pdfs(input1, input2, output_file=None):
             logger.error(f"File not found: {pdf}")
             return False
     
-    merger.write(output_file)
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        merger.write(temp_path)
     merger.close()
-    logger.info(f"Merge complete: {os.path.basename(output_file)}")
-    return True
+    logger.info(f"Merge complete: {os.path.basename(output.path)}")
+    return output.path
 
 @safe_file_operation
-def perform_multi_merge(pdf_list, output_file=None):
+def perform_multi_merge(pdf_list, output_file=None, skip_duplicates=False, preserve_structure=False):
     """Merge multiple PDF files"""
+    if skip_duplicates:
+        pdf_list = unique_files(pdf_list)
+    
     if len(pdf_list) < 2:
         return False
     
     output_dir = get_single_output_dir()
-    if output_file is None:
+    unique = output_file is None
+    if unique:
         pdf_names = [get_base_name(pdf) for pdf in pdf_list]
         output_filename = "(" + ")+(".join(pdf_names) + ").pdf"
         output_file = os.path.join(output_dir, output_filename)
 
     logger.info(f"Starting multi-merge of {len(pdf_list)} PDFs")
+    if preserve_structure:
+        return _merge_with_structure(pdf_list, output_file, unique)
+    
     merger = PyPDF2.PdfMerger()
     
     for i, pdf_path in enumerate(pdf_list):
@@ -159,13 +544,15 @@ def perform_multi_merge(pdf_list, output_file=None):
         else:
             logger.error(f"File not found: {pdf_path}")
     
-    merger.write(output_file)
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        merger.write(temp_path)
     merger.close()
-    logger.info(f"Multi-merge complete: {output_file}")
-    return True
+    logger.info(f"Multi-merge complete: {output.path}")
+    return output.path
 
 @safe_file_operation
-def split_pdf(input_file):
+def split_pdf(input_file, journal=None, preserve_structure=False, job_name="split_pdf"):
     """Split PDF into individual pages"""
     if not os.path.exists(input_file):
         logger.error(f"File not found: {input_file}")
@@ -175,17 +562,163 @@ def split_pdf(input_file):
     # Multiple output files - use subdirectory
     output_dir = get_output_subdir(input_file)
     base_name = get_base_name(input_file)
+    input_hash = file_hash(input_file) if journal else None
+    skipped = 0
+    
+    if preserve_structure:
+        source = fitz.open(input_file)
+        toc = source.get_toc(simple=False)
+        labels = source.get_page_labels()
+        named = _named_link_targets(source)
     
     for i, page in enumerate(reader.pages):
-        writer = PyPDF2.PdfWriter()
-        writer.add_page(page)
-        output_path = os.path.join(output_dir, f"{base_name} - Page {i+1}.pdf")
+        item = f"Page {i+1}"
+        output_path = os.path.join(output_dir, f"{base_name} - {item}.pdf")
+        
+        # Resumed runs skip pages already written from this exact input
+        if journal and journal.is_complete(job_name, input_file, input_hash, item):
+            skipped += 1
+            continue
+        
+        if preserve_structure:
+            _write_page_with_structure(source, i, output_path, base_name, toc, labels, named)
+        else:
+            writer = PyPDF2.PdfWriter()
+            writer.add_page(page)
+            
+            with atomic_output(output_path) as temp_path:
+                with open(temp_path, "wb") as output_pdf:
+                    writer.write(output_pdf)
         
-        with open(output_path, "wb") as output_pdf:
-            writer.write(output_pdf)
+        if journal:
+            journal.mark_complete(job_name, input_file, input_hash, item, output_path)
     
-    logger.info(f"Split complete: {len(reader.pages)} pages created")
-    return True
+    if preserve_structure:
+        source.close()
+    
+    logger.info(f"Split complete: {len(reader.pages) - skipped} pages created, {skipped} already done")
+    return output_dir
+
+def _named_link_targets(source):
+    """Return {destination name: (page index, point)} for a document's named destinations"""
+    targets = {}
+    for name, dest in source.resolve_names().items():
+        page_index = dest.get("page", -1)
+        if not 0 <= page_index < source.page_count:
+            continue
+        # resolve_names reports PDF coordinates; links take page coordinates (origin top-left)
+        to = dest.get("to")
+        point = fitz.Point(to) * source[page_index].transformation_matrix if to else fitz.Point(0, 0)
+        targets[name] = (page_index, point)
+    return targets
+
+def _merge_with_structure(pdf_list, output_file, unique=False):
+    """Merge PDFs keeping outlines, internal links and page labels, in a single write"""
+    # Check every input up front, so a missing file never yields a merge that silently lacks it
+    missing = [pdf_path for pdf_path in pdf_list if not os.path.exists(pdf_path)]
+    if missing:
+        for pdf_path in missing:
+            logger.error(f"File not found: {pdf_path}")
+        return False
+    
+    merged = fitz.open()
+    toc, labels, any_labels = [], [], False
+    
+    for i, pdf_path in enumerate(pdf_list):
+        logger.info(f"Adding PDF {i+1}/{len(pdf_list)}: {os.path.basename(pdf_path)}")
+        source = fitz.open(pdf_path)
+        offset = merged.page_count
+        # links=True re-targets links between the copied pages to their new positions
+        merged.insert_pdf(source, links=True, annots=True)
+        
+        # insert_pdf drops links to named destinations, so add them back as explicit ones
+        named = _named_link_targets(source)
+        if named:
+            for page_index in range(source.page_count):
+                for link in source[page_index].get_links():
+                    if link["kind"] == fitz.LINK_NAMED and link.get("nameddest") in named:
+                        target_page, to = named[link["nameddest"]]
+                        merged[offset + page_index].insert_link({
+                            "kind": fitz.LINK_GOTO,
+                            "from": link["from"],
+                            "page": offset + target_page,
+                            "to": to,
+                        })
+        
+        # One top-level bookmark per input, with the input's own outline nested beneath it
+        toc.append([1, get_base_name(pdf_path), offset + 1])
+        for level, title, page, *_ in source.get_toc(simple=True):
+            toc.append([level + 1, title, page + offset if page > 0 else -1])
+        
+        source_labels = source.get_page_labels()
+        if source_labels:
+            any_labels = True
+            labels.extend(dict(rule, startpage=rule["startpage"] + offset) for rule in source_labels)
+        else:
+            # Unlabelled inputs keep plain page numbers within the merged document
+            labels.append({"startpage": offset, "prefix": "", "style": "D", "firstpagenum": offset + 1})
+        source.close()
+    
+    merged.set_toc(toc)
+    if any_labels:
+        merged.set_page_labels(labels)
+    
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        merged.save(temp_path, garbage=3, deflate=True)
+    merged.close()
+    logger.info(f"Structure-preserving merge complete: {os.path.basename(output.path)} ({len(pdf_list)} inputs)")
+    return output.path
+
+def _page_label(labels, page_index):
+    """Return the page label rule that applies to a single page, rebased to start there"""
+    rules = [rule for rule in labels if rule["startpage"] <= page_index]
+    if not rules:
+        return None
+    rule = max(rules, key=lambda r: r["startpage"])
+    return dict(rule, startpage=0, firstpagenum=rule.get("firstpagenum", 1) + page_index - rule["startpage"])
+
+def _write_page_with_structure(source, page_index, output_path, base_name, toc, labels, named):
+    """Write one page with its outline entries, label and links to the other split pages"""
+    page_doc = fitz.open()
+    page_doc.insert_pdf(source, from_page=page_index, to_page=page_index, links=True, annots=True)
+    
+    # Links to other pages now point at the split file that holds that page
+    new_page = page_doc[0]
+    for link in source[page_index].get_links():
+        if link["kind"] == fitz.LINK_NAMED and link.get("nameddest") in named:
+            target_page, to = named[link["nameddest"]]
+        elif link["kind"] == fitz.LINK_GOTO:
+            target_page, to = link.get("page", -1), link.get("to", fitz.Point(0, 0))
+        else:
+            continue
+        
+        if target_page == page_index:
+            # insert_pdf keeps explicit links within the page, but not named ones
+            if link["kind"] == fitz.LINK_NAMED:
+                new_page.insert_link({"kind": fitz.LINK_GOTO, "from": link["from"], "page": 0, "to": to})
+        elif target_page != -1:
+            # GoToR targets are written as given, so convert back to PDF coordinates
+            new_page.insert_link({
+                "kind": fitz.LINK_GOTOR,
+                "from": link["from"],
+                "file": f"{base_name} - Page {target_page + 1}.pdf",
+                "page": 0,
+                "to": to * ~source[target_page].transformation_matrix,
+            })
+    
+    # Keep the outline entries that land on this page, flattened to top level
+    page_toc = [[1, title, 1] for level, title, page, *_ in toc if page == page_index + 1]
+    if page_toc:
+        page_doc.set_toc(page_toc)
+    
+    label = _page_label(labels, page_index)
+    if label:
+        page_doc.set_page_labels([label])
+    
+    with atomic_output(output_path) as temp_path:
+        page_doc.save(temp_path, garbage=3, deflate=True)
+    page_doc.close()
 
 @safe_file_operation
 def delete_page(input_file, page_number, output_file=None):
@@ -196,7 +729,8 @@ def delete_page(input_file, page_number, output_file=None):
     
     # Single output file - save to main pdfs directory
     output_dir = get_single_output_dir()
-    if output_file is None:
+    unique = output_file is None
+    if unique:
         base_name = get_base_name(input_file)
         output_file = os.path.join(output_dir, f"{base_name} (Page {page_number} Removed).pdf")
 
@@ -207,11 +741,13 @@ def delete_page(input_file, page_number, output_file=None):
         if i != page_number - 1:  # Skip the page to delete
             writer.add_page(page)
     
-    with open(output_file, "wb") as f:
-        writer.write(f)
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        with open(temp_path, "wb") as f:
+            writer.write(f)
     
     logger.info(f"Page {page_number} deleted from {os.path.basename(input_file)}")
-    return True
+    return output.path
 
 @safe_file_operation
 def duplicate_page(input_file, page_number, output_file=None):
@@ -222,7 +758,8 @@ def duplicate_page(input_file, page_number, output_file=None):
     
     # Single output file - save to main pdfs directory
     output_dir = get_single_output_dir()
-    if output_file is None:
+    unique = output_file is None
+    if unique:
         base_name = get_base_name(input_file)
         output_file = os.path.join(output_dir, f"{base_name} (Page {page_number} Duplicated).pdf")
 
@@ -240,11 +777,13 @@ def duplicate_page(input_file, page_number, output_file=None):
     for i in range(page_number, len(reader.pages)):
         writer.add_page(reader.pages[i])
     
-    with open(output_file, "wb") as f:
-        writer.write(f)
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        with open(temp_path, "wb") as f:
+            writer.write(f)
     
     logger.info(f"Page {page_number} duplicated in {os.path.basename(input_file)}")
-    return True
+    return output.path
 
 @safe_file_operation
 def ocr_pdf(input_file, output_file=None):
@@ -255,22 +794,26 @@ def ocr_pdf(input_file, output_file=None):
     
     # Single output file - save to main pdfs directory
     output_dir = get_single_output_dir()
-    if output_file is None:
+    unique = output_file is None
+    if unique:
         base_name = get_base_name(input_file)
         output_file = os.path.join(output_dir, f"{base_name} - Text.txt")
 
     logger.info(f"Starting text extraction for {os.path.basename(input_file)}")
     
     doc = fitz.open(input_file)
-    with open(output_file, "w", encoding="utf-8") as out_txt:
-        for i, page in enumerate(doc):
-            text = page.get_text()
-            out_txt.write(f"--- Page {i+1} ---\n{text}\n\n")
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        with open(temp_path, "w", encoding="utf-8") as out_txt:
+            for i, page in enumerate(doc):
+                text = page.get_text()
+                out_txt.write(f"--- Page {i+1} ---\n{text}\n\n")
     
     doc.close()
-    logger.info(f"Text extraction complete: {os.path.basename(output_file)}")
-    return True
+    logger.info(f"Text extraction complete: {os.path.basename(output.path)}")
+    return output.path
 
+@profile_operation
 def decrypt_pdf(input_file, password=None, output_file=None):
     """Remove encryption from PDF file"""
     if not os.path.exists(input_file):
@@ -284,7 +827,8 @@ def decrypt_pdf(input_file, password=None, output_file=None):
     try:
         # Single output file - save to main pdfs directory
         output_dir = get_single_output_dir()
-        if output_file is None:
+        unique = output_file is None
+        if unique:
             base_name = get_base_name(input_file)
             output_file = os.path.join(output_dir, f"{base_name} (Unlocked).pdf")
 
@@ -295,9 +839,10 @@ def decrypt_pdf(input_file, password=None, output_file=None):
         # Handle unencrypted PDFs
         if not reader.is_encrypted:
             logger.info("PDF is not encrypted")
-            import shutil
-            shutil.copy2(input_file, output_file)
-            return True
+            output = atomic_output(output_file, unique)
+            with output as temp_path:
+                shutil.copy2(input_file, temp_path)
+            return output.path
         
         # Try common passwords
         common_passwords = ["", "password", "123456", "admin", "user", "pdf", "document"]
@@ -314,24 +859,26 @@ def decrypt_pdf(input_file, password=None, output_file=None):
             return False
         
         # Try PyMuPDF first (more reliable)
-        return _decrypt_with_pymupdf(input_file, output_file, common_passwords) or \
-               _decrypt_with_pypdf2(reader, output_file)
+        return (_decrypt_with_pymupdf(input_file, output_file, common_passwords, unique) or
+                _decrypt_with_pypdf2(reader, output_file, unique))
         
     except Exception as e:
         logger.error(f"Decryption failed: {e}", exc_info=True)
         return False
 
-def _decrypt_with_pymupdf(input_file, output_file, passwords):
-    """Decrypt using PyMuPDF (preferred method)"""
+def _decrypt_with_pymupdf(input_file, output_file, passwords, unique=False):
+    """Decrypt using PyMuPDF (preferred method), returning the path written or False"""
     try:
         doc = fitz.open(input_file)
         
         for pwd in passwords:
             if doc.authenticate(pwd):
-                doc.save(output_file)
+                output = atomic_output(output_file, unique)
+                with output as temp_path:
+                    doc.save(temp_path)
                 doc.close()
                 logger.info("Decryption successful using PyMuPDF")
-                return True
+                return output.path
         
         doc.close()
         return False
@@ -340,8 +887,8 @@ def _decrypt_with_pymupdf(input_file, output_file, passwords):
         logger.warning(f"PyMuPDF decryption failed: {e}")
         return False
 
-def _decrypt_with_pypdf2(reader, output_file):
-    """Fallback decryption using PyPDF2"""
+def _decrypt_with_pypdf2(reader, output_file, unique=False):
+    """Fallback decryption using PyPDF2, returning the path written or False"""
     try:
         writer = PyPDF2.PdfWriter()
         successful_pages = 0
@@ -356,119 +903,1692 @@ def _decrypt_with_pypdf2(reader, output_file):
         if successful_pages == 0:
             return False
         
-        with open(output_file, "wb") as f:
-            writer.write(f)
+        output = atomic_output(output_file, unique)
+        with output as temp_path:
+            with open(temp_path, "wb") as f:
+                writer.write(f)
+        
+        logger.info(f"PyPDF2 decryption complete: {successful_pages} pages processed")
+        return output.path
+        
+    except Exception as e:
+        logger.error(f"PyPDF2 decryption failed: {e}")
+        return False
+
+@safe_file_operation
+def rotate_pdf(input_file, rotation, output_file=None):
+    """Rotate pages in PDF by 90, 180, or 270 degrees"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return False
+    
+    valid_rotations = {90, 180, 270}
+    if rotation not in valid_rotations:
+        logger.error(f"Invalid rotation: {rotation}. Must be 90, 180, or 270")
+        return False
+    
+    output_dir = get_single_output_dir()
+    unique = output_file is None
+    if unique:
+        base_name = get_base_name(input_file)
+        output_file = os.path.join(output_dir, f"{base_name} ({rotation}° Rotated).pdf")
+
+    logger.info(f"Rotating {os.path.basename(input_file)} by {rotation}°")
+    
+    doc = fitz.open(input_file)
+    for page in doc:
+        page.set_rotation(page.rotation + rotation)
+    
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        doc.save(temp_path)
+    doc.close()
+    logger.info(f"Rotation complete: {os.path.basename(output.path)}")
+    return output.path
+
+@safe_file_operation
+def get_pdf_metadata(input_file):
+    """Get metadata from PDF"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return None
+    
+    doc = fitz.open(input_file)
+    metadata = doc.metadata
+    doc.close()
+    return metadata
+
+@safe_file_operation
+def set_pdf_metadata(input_file, metadata, output_file=None):
+    """Set metadata for PDF"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return False
+    
+    output_dir = get_single_output_dir()
+    unique = output_file is None
+    if unique:
+        base_name = get_base_name(input_file)
+        output_file = os.path.join(output_dir, f"{base_name} (Metadata Updated).pdf")
+
+    logger.info(f"Updating metadata for {os.path.basename(input_file)}")
+    
+    doc = fitz.open(input_file)
+    if metadata.get('title'):
+        doc.set_metadata({'/Title': metadata['title']})
+    if metadata.get('author'):
+        doc.set_metadata({'/Author': metadata['author']})
+    if metadata.get('subject'):
+        doc.set_metadata({'/Subject': metadata['subject']})
+    if metadata.get('creator'):
+        doc.set_metadata({'/Creator': metadata['creator']})
+    if metadata.get('producer'):
+        doc.set_metadata({'/Producer': metadata['producer']})
+    
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        doc.save(temp_path)
+    doc.close()
+    logger.info(f"Metadata update complete: {os.path.basename(output.path)}")
+    return output.path
+
+@safe_file_operation
+def compress_pdf(input_file, compression_level=6, output_file=None):
+    """Compress PDF to reduce file size"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return False
+    
+    if not 0 <= compression_level <= 9:
+        compression_level = 6
+    
+    output_dir = get_single_output_dir()
+    unique = output_file is None
+    if unique:
+        base_name = get_base_name(input_file)
+        output_file = os.path.join(output_dir, f"{base_name} (Compressed).pdf")
+
+    logger.info(f"Compressing {os.path.basename(input_file)} (level {compression_level})")
+    
+    doc = fitz.open(input_file)
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        doc.save(
+            temp_path,
+            garbage=4,
+            deflate=True,
+            compression_effort=compression_level * 11,
+            clean=True
+        )
+    doc.close()
+    
+    original_size = os.path.getsize(input_file)
+    compressed_size = os.path.getsize(output.path)
+    ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
+    logger.info(f"Compression complete: {ratio:.1f}% size reduction")
+    return output.path
+
+# Optimization Functions
+VIEWER_RANGE_CHUNK = 65536  # bytes per range request, the chunk size pdf.js uses
+
+class _RangeRequestHandler(http.server.SimpleHTTPRequestHandler):
+    """Static file handler with HTTP Range support and a throttled, high-latency link"""
+    bandwidth = 1_000_000  # bytes per second
+    latency = 0.05         # seconds per request
+    
+    def do_GET(self):
+        path = self.translate_path(self.path)
+        if not os.path.isfile(path):
+            self.send_error(404)
+            return
+        
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match:
+            start = int(match.group(1))
+            end = min(int(match.group(2)) if match.group(2) else size - 1, size - 1)
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Type", "application/pdf")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        
+        time.sleep(self.latency)
+        with open(path, "rb") as f:
+            f.seek(start)
+            remaining = end - start + 1
+            while remaining > 0:
+                chunk = f.read(min(64 * 1024, remaining))
+                self.wfile.write(chunk)
+                remaining -= len(chunk)
+                time.sleep(len(chunk) / self.bandwidth)
+    
+    def log_message(self, format, *args):
+        pass  # Keep per-request lines out of the application log
+
+class _HTTPRangeFile(io.RawIOBase):
+    """Seekable, read-only view of a served file that fetches fixed-size chunks on demand"""
+    
+    def __init__(self, url, chunk_size=VIEWER_RANGE_CHUNK):
+        self.url = url
+        self.chunk_size = chunk_size
+        self.chunks = {}
+        self.size = None
+        self.position = 0
+    
+    def _fetch(self, first, last):
+        """Fetch chunks first..last in a single range request"""
+        end = (last + 1) * self.chunk_size - 1
+        request = urllib.request.Request(self.url, headers={"Range": f"bytes={first * self.chunk_size}-{end}"})
+        with urllib.request.urlopen(request) as response:
+            self.size = int(response.headers["Content-Range"].rsplit("/", 1)[1])
+            data = response.read()
+        for offset in range(0, len(data), self.chunk_size):
+            self.chunks[first + offset // self.chunk_size] = data[offset:offset + self.chunk_size]
+    
+    def readable(self):
+        return True
+    
+    def seekable(self):
+        return True
+    
+    def seek(self, offset, whence=io.SEEK_SET):
+        if whence == io.SEEK_END:
+            if self.size is None:
+                self._fetch(0, 0)
+            offset += self.size
+        elif whence == io.SEEK_CUR:
+            offset += self.position
+        self.position = max(offset, 0)
+        return self.position
+    
+    def tell(self):
+        return self.position
+    
+    def readinto(self, buffer):
+        if self.size is None:
+            self._fetch(0, 0)
+        end = min(self.position + len(buffer), self.size)
+        if end <= self.position:
+            return 0
+        
+        needed = range(self.position // self.chunk_size, (end - 1) // self.chunk_size + 1)
+        missing = [index for index in needed if index not in self.chunks]
+        # One request per run of consecutive missing chunks, as a range-aware viewer would
+        while missing:
+            run_end = 0
+            while run_end + 1 < len(missing) and missing[run_end + 1] == missing[run_end] + 1:
+                run_end += 1
+            self._fetch(missing[0], missing[run_end])
+            missing = missing[run_end + 1:]
+        
+        data = b"".join(self.chunks[index] for index in needed)
+        offset = self.position - needed[0] * self.chunk_size
+        count = end - self.position
+        buffer[:count] = data[offset:offset + count]
+        self.position = end
+        return count
+
+def _load_first_page(reader):
+    """Resolve every object page 1 needs to draw, following the page tree down its first branch"""
+    node = reader.trailer["/Root"].get_object()["/Pages"].get_object()
+    while node.get("/Type") != "/Page":
+        node = node["/Kids"][0].get_object()
+    
+    pending, seen = [node], set()
+    while pending:
+        obj = pending.pop()
+        if isinstance(obj, PyPDF2.generic.IndirectObject):
+            if obj.idnum in seen:
+                continue
+            seen.add(obj.idnum)
+            obj = obj.get_object()
+        if isinstance(obj, PyPDF2.generic.StreamObject):
+            obj.get_data()
+        if isinstance(obj, dict):
+            # /Parent leads back up the tree to every other page
+            pending.extend(value for key, value in obj.items() if key not in ("/Parent", "/P"))
+        elif isinstance(obj, list):
+            pending.extend(obj)
+
+def _time_to_first_page(url):
+    """Time how long a range-aware viewer waits before it can draw page 1"""
+    start = time.perf_counter()
+    remote = _HTTPRangeFile(url)
+    head = remote.read(1024)
+    
+    # Linearized files announce where page 1 ends (/E); a viewer needs nothing past it
+    match = re.search(rb"/Linearized.*?/E\s+(\d+)", head, re.DOTALL)
+    if match:
+        remote.seek(0)
+        remote.read(int(match.group(1)))
+    else:
+        # Otherwise: read the trailer and xref from the tail, then fetch only page 1's objects
+        _load_first_page(PyPDF2.PdfReader(remote))
+    
+    return time.perf_counter() - start
+
+def _linearize_pdf(path, object_streams):
+    """Rewrite a PDF in place for fast web view using qpdf (via pikepdf)"""
+    if not PIKEPDF_AVAILABLE:
+        logger.warning("pikepdf not available - skipping linearization")
+        return False
+    
+    # MuPDF 1.26+ can no longer write linearized files, so qpdf does this step
+    mode = pikepdf.ObjectStreamMode.generate if object_streams else pikepdf.ObjectStreamMode.preserve
+    with pikepdf.open(path, allow_overwriting_input=True) as pdf:
+        pdf.save(path, linearize=True, object_stream_mode=mode, compress_streams=True)
+    return True
+
+@safe_file_operation
+def optimize_pdf(input_file, linearize=True, object_streams=True, subset_fonts=True, remove_unused=True,
+                 output_file=None):
+    """Optimize PDF for size and fast web view"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return False
+    
+    output_dir = get_single_output_dir()
+    unique = output_file is None
+    if unique:
+        base_name = get_base_name(input_file)
+        output_file = os.path.join(output_dir, f"{base_name} (Optimized).pdf")
+    
+    settings = [name for name, enabled in [("linearize", linearize), ("object streams", object_streams),
+                                           ("font subsetting", subset_fonts), ("remove unused", remove_unused)]
+                if enabled]
+    logger.info(f"Optimizing {os.path.basename(input_file)} ({', '.join(settings) or 'compression only'})")
+    
+    doc = fitz.open(input_file)
+    if subset_fonts:
+        doc.subset_fonts()
+    
+    save_options = {"deflate": True, "deflate_images": True, "deflate_fonts": True,
+                    "use_objstms": int(object_streams)}
+    if remove_unused:
+        # garbage=4 drops unreferenced and duplicate objects; clean drops unused page resources
+        save_options.update(garbage=4, clean=True)
+    
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        doc.save(temp_path, **save_options)
+        doc.close()
+        if linearize:
+            _linearize_pdf(temp_path, object_streams)
+    
+    original_size = os.path.getsize(input_file)
+    optimized_size = os.path.getsize(output.path)
+    logger.info(f"Optimization complete: {original_size - optimized_size} bytes saved "
+                f"({original_size} -> {optimized_size})")
+    return output.path
+
+@safe_file_operation
+def benchmark_optimization(input_file, bandwidth=1_000_000, latency=0.05, **options):
+    """Measure bytes saved and time-to-first-page over a throttled local HTTP range server"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return None
+    
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        shutil.copy2(input_file, os.path.join(scratch_dir, "original.pdf"))
+        if not optimize_pdf(input_file, output_file=os.path.join(scratch_dir, "optimized.pdf"), **options):
+            return None
+        
+        handler = type("Handler", (_RangeRequestHandler,), {"bandwidth": bandwidth, "latency": latency})
+        server = http.server.ThreadingHTTPServer(("127.0.0.1", 0), functools.partial(handler, directory=scratch_dir))
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            base_url = f"http://127.0.0.1:{server.server_address[1]}"
+            results = {
+                "original_bytes": os.path.getsize(os.path.join(scratch_dir, "original.pdf")),
+                "optimized_bytes": os.path.getsize(os.path.join(scratch_dir, "optimized.pdf")),
+                "original_first_page": _time_to_first_page(f"{base_url}/original.pdf"),
+                "optimized_first_page": _time_to_first_page(f"{base_url}/optimized.pdf"),
+            }
+        finally:
+            server.shutdown()
+            server.server_close()
+    
+    results["bytes_saved"] = results["original_bytes"] - results["optimized_bytes"]
+    logger.info(f"Optimization benchmark: {results['bytes_saved']} bytes saved, first page "
+                f"{results['original_first_page']:.2f}s -> {results['optimized_first_page']:.2f}s "
+                f"at {bandwidth / 1000:.0f} kB/s")
+    return results
+
+# Stamping and Redaction Functions
+BATES_DIGITS = 6
+
+def _build_watermark_pdf(text, opacity):
+    """Return a one-page PDF holding diagonal watermark text, to be shown as a shared XObject"""
+    doc = fitz.open()
+    page = doc.new_page(width=600, height=600)
+    fontsize = min(150, 750 / max(fitz.get_text_length(text, fontname="helv", fontsize=1), 1))
+    width = fitz.get_text_length(text, fontname="helv", fontsize=fontsize)
+    centre = fitz.Point(300, 300)
+    page.insert_text(
+        fitz.Point(300 - width / 2, 300 + fontsize / 3),
+        text,
+        fontname="helv",
+        fontsize=fontsize,
+        color=(0.6, 0, 0),
+        fill_opacity=opacity,
+        morph=(centre, fitz.Matrix(-45))
+    )
+    watermark = doc.tobytes()
+    doc.close()
+    return watermark
+
+def _page_characters(page):
+    """Return a page's text and, per character, its (bbox, line number); line breaks get None"""
+    chars, boxes = [], []
+    line_number = 0
+    # Font-size glyph boxes, so a redaction never reaches into a tightly spaced neighbouring line
+    small_glyphs = fitz.TOOLS.set_small_glyph_heights()
+    fitz.TOOLS.set_small_glyph_heights(True)
+    try:
+        data = page.get_text("rawdict")
+    finally:
+        fitz.TOOLS.set_small_glyph_heights(small_glyphs)
+    
+    for block in data["blocks"]:
+        for line in block.get("lines", ()):
+            for span in line["spans"]:
+                for char in span["chars"]:
+                    chars.append(char["c"])
+                    boxes.append((char["bbox"], line_number))
+            chars.append("\n")
+            boxes.append(None)
+            line_number += 1
+    return "".join(chars), boxes
+
+def _span_rects(boxes, start, end):
+    """Return one rectangle per text line covering the characters in text[start:end]"""
+    rects = {}
+    for box in boxes[start:end]:
+        if box is not None:
+            bbox, line_number = box
+            rects[line_number] = rects[line_number] | bbox if line_number in rects else fitz.Rect(bbox)
+    return list(rects.values())
+
+def _stamp_document(input_file, output_file, watermark_pdf=None, image_bytes=None,
+                    bates_prefix=None, bates_start=1, patterns=None, unique=False):
+    """Apply redactions, then watermark, image stamp and Bates numbers to one PDF"""
+    doc = fitz.open(input_file)
+    watermark = fitz.open("pdf", watermark_pdf) if watermark_pdf else None
+    image_xref = 0
+    redactions = 0
+    
+    for i, page in enumerate(doc):
+        if patterns:
+            text, boxes = _page_characters(page)
+            matches = [match.span() for pattern in patterns for match in pattern.finditer(text) if match.group().strip()]
+            # Redact exactly the matched characters, so case and surrounding text are respected
+            for start, end in matches:
+                for rect in _span_rects(boxes, start, end):
+                    page.add_redact_annot(rect, fill=(0, 0, 0))
+            redactions += len(matches)
+            if matches:
+                page.apply_redactions()
+        
+        if watermark:
+            # The same source page becomes one Form XObject, referenced from every page
+            page.show_pdf_page(page.rect, watermark, 0, overlay=True)
+        
+        if image_bytes:
+            rect = page.rect
+            box = fitz.Rect(rect.width * 0.3, rect.height * 0.3, rect.width * 0.7, rect.height * 0.7)
+            # Passing the first insert's xref back in reuses the embedded image on later pages
+            image_xref = page.insert_image(box, stream=image_bytes if not image_xref else None,
+                                           xref=image_xref, keep_proportion=True, overlay=True)
+        
+        if bates_prefix is not None:
+            label = f"{bates_prefix}{bates_start + i:0{BATES_DIGITS}d}"
+            width = fitz.get_text_length(label, fontname="helv", fontsize=10)
+            page.insert_text(
+                fitz.Point(page.rect.width - width - 36, page.rect.height - 24),
+                label,
+                fontname="helv",
+                fontsize=10
+            )
+    
+    page_count = doc.page_count
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        doc.save(temp_path, garbage=3, deflate=True)
+    doc.close()
+    if watermark:
+        watermark.close()
+    return output.path, page_count, redactions
+
+def _stamp_output_path(input_file, stamping):
+    """Return the default output path for a stamped or redacted PDF"""
+    base_name = get_base_name(input_file)
+    label = "Stamped" if stamping else "Redacted"
+    return os.path.join(get_single_output_dir(), f"{base_name} ({label}).pdf")
+
+def _stamp_file_range(file_jobs, watermark_pdf, image_bytes, bates_prefix, patterns):
+    """Worker: stamp a list of (input, output, bates start) jobs (runs in a child process)"""
+    stamped = 0
+    for input_file, output_file, bates_start in file_jobs:
+        try:
+            # Inputs with the same name in different folders each get their own " (n)" output
+            output_path, _, redactions = _stamp_document(input_file, output_file, watermark_pdf, image_bytes,
+                                                         bates_prefix, bates_start, patterns, unique=True)
+            logger.info(f"Stamped {os.path.basename(input_file)} into {os.path.basename(output_path)} "
+                        f"({redactions} redactions)")
+            stamped += 1
+        except Exception as e:
+            logger.error(f"Error stamping {input_file}: {e}", exc_info=True)
+    return stamped
+
+def _prepare_stamp_resources(watermark_text, image_file, opacity, redact_patterns):
+    """Build the shared watermark, image and regex resources once for a whole run"""
+    watermark_pdf = _build_watermark_pdf(watermark_text, opacity) if watermark_text else None
+    image_bytes = None
+    if image_file:
+        with open(image_file, "rb") as f:
+            image_bytes = f.read()
+    patterns = [re.compile(pattern) for pattern in redact_patterns or []]
+    return watermark_pdf, image_bytes, patterns
+
+@safe_file_operation
+def stamp_pdf(input_file, watermark_text=None, image_file=None, bates_prefix=None, bates_start=1,
+              redact_patterns=None, opacity=0.3, output_file=None):
+    """Redact regex matches and add a watermark, image stamp and/or Bates numbers to a PDF"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return False
+    
+    stamping = bool(watermark_text or image_file or bates_prefix is not None)
+    if not stamping and not redact_patterns:
+        logger.error("Nothing to do - give watermark text, an image, a Bates prefix or redaction patterns")
+        return False
+    
+    unique = output_file is None
+    if unique:
+        output_file = _stamp_output_path(input_file, stamping)
+    
+    logger.info(f"Stamping {os.path.basename(input_file)}")
+    watermark_pdf, image_bytes, patterns = _prepare_stamp_resources(watermark_text, image_file, opacity, redact_patterns)
+    output_file, page_count, redactions = _stamp_document(input_file, output_file, watermark_pdf, image_bytes,
+                                                          bates_prefix, bates_start, patterns, unique)
+    
+    logger.info(f"Stamping complete: {os.path.basename(output_file)} ({page_count} pages, {redactions} redactions)")
+    return output_file
+
+@safe_file_operation
+def stamp_pdfs(input_files, watermark_text=None, image_file=None, bates_prefix=None, bates_start=1,
+               redact_patterns=None, opacity=0.3, workers=None):
+    """Stamp and/or redact many PDFs in parallel; Bates numbers continue across files"""
+    stamping = bool(watermark_text or image_file or bates_prefix is not None)
+    if not stamping and not redact_patterns:
+        logger.error("Nothing to do - give watermark text, an image, a Bates prefix or redaction patterns")
+        return False
+    
+    # Bates numbering runs on from one file to the next, so work out each file's start up front
+    file_jobs = []
+    for input_file in input_files:
+        if not os.path.exists(input_file):
+            logger.error(f"File not found: {input_file}")
+            continue
+        file_jobs.append((input_file, _stamp_output_path(input_file, stamping), bates_start))
+        if bates_prefix is not None:
+            doc = fitz.open(input_file)
+            bates_start += doc.page_count
+            doc.close()
+    
+    workers = get_worker_count(workers)
+    logger.info(f"Stamping {len(file_jobs)} PDFs ({workers} workers)")
+    
+    watermark_pdf, image_bytes, patterns = _prepare_stamp_resources(watermark_text, image_file, opacity, redact_patterns)
+    jobs = [(chunk, watermark_pdf, image_bytes, bates_prefix, patterns)
+            for chunk in split_into_chunks(file_jobs, workers * 2)]
+    stamped = sum(run_in_workers(_stamp_file_range, jobs, workers))
+    
+    logger.info(f"Batch stamping complete: {stamped}/{len(file_jobs)} PDFs stamped")
+    return stamped == len(file_jobs)
+
+# Image Export Functions
+IMAGE_FORMATS = {"png": "png", "jpg": "jpg", "jpeg": "jpg", "webp": "webp"}
+
+def _save_pixmap(pix, output_path, image_format, quality):
+    """Encode a pixmap to disk in the requested format"""
+    with atomic_output(output_path) as temp_path:
+        if image_format == "webp":
+            pix.pil_save(temp_path, format="WEBP", quality=quality)
+        elif image_format == "jpg":
+            pix.save(temp_path, jpg_quality=quality)
+        else:
+            pix.save(temp_path)
+
+def _render_page_range(input_file, page_numbers, dpi, image_format, quality, transparent, output_dir, base_name):
+    """Worker: render a range of pages to image files (runs in a child process)"""
+    doc = fitz.open(input_file)
+    # JPEG has no alpha channel, so transparency only applies to PNG and WebP
+    alpha = transparent and image_format != "jpg"
+    
+    for page_number in page_numbers:
+        pix = doc[page_number].get_pixmap(dpi=dpi, colorspace=fitz.csRGB, alpha=alpha)
+        output_path = os.path.join(output_dir, f"{base_name} - Page {page_number+1}.{image_format}")
+        _save_pixmap(pix, output_path, image_format, quality)
+    
+    doc.close()
+    return len(page_numbers)
+
+def _extract_image_range(input_file, image_jobs, output_dir, base_name):
+    """Worker: write embedded images to disk by xref (runs in a child process)"""
+    doc = fitz.open(input_file)
+    extracted = 0
+    
+    for xref, page_number, index in image_jobs:
+        name = f"{base_name} - Page {page_number+1} Image {index+1}"
+        try:
+            info = doc.extract_image(xref)
+            if not info:
+                continue
+            
+            if info.get("smask"):
+                # Soft masks live in a separate xref; recombine them so alpha survives
+                try:
+                    pix = fitz.Pixmap(doc, xref)
+                    if pix.alpha:
+                        pix = fitz.Pixmap(pix, 0)
+                    if pix.colorspace and pix.colorspace.n > 3:
+                        pix = fitz.Pixmap(fitz.csRGB, pix)
+                    pix = fitz.Pixmap(pix, fitz.Pixmap(doc, info["smask"]))
+                    _save_pixmap(pix, os.path.join(output_dir, f"{name}.png"), "png", None)
+                    extracted += 1
+                    continue
+                except Exception as e:
+                    # e.g. a mask whose size differs from the image: keep the image, lose the alpha
+                    logger.warning(f"Could not apply soft mask to image xref {xref}, "
+                                   f"writing it without transparency: {e}")
+            
+            # Write the stored stream untouched - no re-encoding, no quality loss
+            with atomic_output(os.path.join(output_dir, f"{name}.{info['ext']}")) as temp_path:
+                with open(temp_path, "wb") as f:
+                    f.write(info["image"])
+            extracted += 1
+        except Exception as e:
+            logger.warning(f"Failed to extract image xref {xref}: {e}")
+    
+    doc.close()
+    return extracted
+
+@safe_file_operation
+def render_pdf_pages(input_file, dpi=150, image_format="png", quality=85, transparent=False,
+                     workers=None, output_dir=None):
+    """Render every page of a PDF to PNG, JPEG or WebP images"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return False
+    
+    image_format = IMAGE_FORMATS.get(image_format.lower())
+    if image_format is None:
+        logger.error(f"Invalid image format. Must be one of: {', '.join(IMAGE_FORMATS)}")
+        return False
+    
+    if image_format == "webp" and not PIL_AVAILABLE:
+        logger.error("Pillow not available - cannot export WebP images")
+        return False
+    
+    # Multiple output files - use subdirectory
+    if output_dir is None:
+        output_dir = get_output_subdir(input_file)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+    base_name = get_base_name(input_file)
+    workers = get_worker_count(workers)
+    
+    doc = fitz.open(input_file)
+    page_count = doc.page_count
+    doc.close()
+    
+    logger.info(f"Rendering {page_count} pages of {os.path.basename(input_file)} at {dpi} DPI "
+                f"as {image_format.upper()} ({workers} workers)")
+    
+    # Two chunks per worker keeps the pool busy when page complexity varies
+    chunks = split_into_chunks(list(range(page_count)), workers * 2)
+    jobs = [(input_file, chunk, dpi, image_format, quality, transparent, output_dir, base_name)
+            for chunk in chunks]
+    rendered = sum(run_in_workers(_render_page_range, jobs, workers))
+    
+    logger.info(f"Render complete: {rendered} images created")
+    return output_dir
+
+@safe_file_operation
+def extract_pdf_images(input_file, workers=None, output_dir=None):
+    """Extract embedded images from a PDF without re-encoding them"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return False
+    
+    # Multiple output files - use subdirectory
+    if output_dir is None:
+        output_dir = get_output_subdir(input_file)
+    else:
+        os.makedirs(output_dir, exist_ok=True)
+    base_name = get_base_name(input_file)
+    workers = get_worker_count(workers)
+    
+    # Images shared between pages are stored once, so extract each xref once
+    doc = fitz.open(input_file)
+    image_jobs, seen_xrefs = [], set()
+    for page_number, page in enumerate(doc):
+        for index, image in enumerate(page.get_images(full=True)):
+            xref = image[0]
+            if xref not in seen_xrefs:
+                seen_xrefs.add(xref)
+                image_jobs.append((xref, page_number, index))
+    doc.close()
+    
+    logger.info(f"Extracting {len(image_jobs)} images from {os.path.basename(input_file)}")
+    
+    jobs = [(input_file, chunk, output_dir, base_name)
+            for chunk in split_into_chunks(image_jobs, workers)]
+    extracted = sum(run_in_workers(_extract_image_range, jobs, workers))
+    
+    logger.info(f"Image extraction complete: {extracted} images created")
+    return output_dir
+
+@safe_file_operation
+def benchmark_render(input_file, dpis=(72, 150, 300), image_format="png", workers=None):
+    """Measure page rendering throughput (pages/s) at several DPIs"""
+    if not os.path.exists(input_file):
+        logger.error(f"File not found: {input_file}")
+        return None
+    
+    doc = fitz.open(input_file)
+    page_count = doc.page_count
+    doc.close()
+    
+    results = {}
+    for dpi in dpis:
+        # Render into a scratch directory so benchmarks never touch ./pdfs
+        with tempfile.TemporaryDirectory() as scratch_dir:
+            start = time.perf_counter()
+            if not render_pdf_pages(input_file, dpi, image_format, workers=workers, output_dir=scratch_dir):
+                return None
+            elapsed = time.perf_counter() - start
+        
+        results[dpi] = page_count / elapsed if elapsed > 0 else 0.0
+        logger.info(f"Render benchmark: {dpi} DPI {image_format.upper()} - {results[dpi]:.1f} pages/s")
+    
+    return results
+
+# Structured Text Extraction Functions
+STRUCTURED_FORMATS = {"markdown": "md", "md": "md", "csv": "csv", "json": "json"}
+CELL_GAP_FACTOR = 1.5       # span gap (in font sizes) that starts a new table cell
+MIN_GUTTER_WIDTH = 10       # points
+FULL_LINE_FRACTION = 0.75   # a cell wider than this share of a region is running text
+HEADING_SIZE_FACTOR = 1.25  # font size relative to the page median that marks a heading
+MIN_PAGES_PER_WORKER = 16   # below this, process start-up costs more than it saves
+
+def _collect_text_cells(page):
+    """Return (boxes, texts) for every text cell on a page, splitting lines on wide span gaps"""
+    data = page.get_text("dict", flags=fitz.TEXTFLAGS_TEXT)
+    boxes, texts = [], []
+    
+    for block in data["blocks"]:
+        if block.get("type") != 0:
+            continue
+        for line in block["lines"]:
+            cell = None
+            for span in line["spans"]:
+                if not span["text"].strip():
+                    continue
+                x0, y0, x1, y1 = span["bbox"]
+                if cell and x0 - cell[2] > span["size"] * CELL_GAP_FACTOR:
+                    boxes.append(cell)
+                    texts.append(cell_text.strip())
+                    cell = None
+                if cell is None:
+                    cell, cell_text = [x0, y0, x1, y1, span["size"]], span["text"]
+                else:
+                    cell = [min(cell[0], x0), min(cell[1], y0), max(cell[2], x1),
+                            max(cell[3], y1), max(cell[4], span["size"])]
+                    cell_text += span["text"]
+            if cell:
+                boxes.append(cell)
+                texts.append(cell_text.strip())
+    
+    return np.array(boxes, dtype=float).reshape(-1, 5), texts
+
+def _mask_runs(mask, min_width=1):
+    """Return (starts, ends) of the runs of True in a 1-D mask at least min_width long"""
+    padded = np.zeros(len(mask) + 2, dtype=bool)
+    padded[1:-1] = mask
+    # Edges alternate rise, fall, rise, ... because the padding is False at both ends
+    edges = np.flatnonzero(padded[1:] != padded[:-1])
+    starts, ends = edges[::2], edges[1::2]
+    wide = (ends - starts) >= min_width
+    return starts[wide], ends[wide]
+
+def _row_runs(mask, min_width=1):
+    """Return (row, start, end) arrays for the runs of True in every row of a 2-D mask"""
+    padded = np.zeros((mask.shape[0], mask.shape[1] + 2), dtype=bool)
+    padded[:, 1:-1] = mask
+    # nonzero walks row by row and every row is padded with False, so edges still alternate
+    rows, edges = np.nonzero(padded[:, 1:] != padded[:, :-1])
+    rows, starts, ends = rows[::2], edges[::2], edges[1::2]
+    wide = (ends - starts) >= min_width
+    return rows[wide], starts[wide], ends[wide]
+
+def _gutter_runs(gaps, left, right):
+    """Return [(start, end), ...] for the gutters inside [left, right) of a gap mask"""
+    starts, ends = _mask_runs(gaps[left:right], MIN_GUTTER_WIDTH)
+    return list(zip((starts + left).tolist(), (ends + left).tolist()))
+
+def _gutter_centres(gutters):
+    """Return the centre of each gutter run"""
+    return np.array([(start + end) / 2.0 for start, end in gutters])
+
+def _runs_overlap(runs, others):
+    """Return True if every run in runs overlaps at least one run in others"""
+    # A page has a handful of gutters at most, so plain loops beat NumPy's per-call overhead
+    return all(any(other_start < end and other_end > start for other_start, other_end in others)
+               for start, end in runs)
+
+def _find_regions(occupied, row_left, row_right, standalone):
+    """Group consecutive rows that keep the same set of empty vertical gutters"""
+    row_count, width = occupied.shape
+    free = ~occupied
+    
+    # Per-row facts that never change while rows are grouped, computed for all rows at once
+    rows, starts, ends = _row_runs(occupied)
+    widest_cell = np.zeros(row_count, dtype=int)
+    np.maximum.at(widest_cell, rows, ends - starts)
+    columns = np.arange(width)
+    inside = (columns >= row_left[:, None]) & (columns < row_right[:, None])
+    rows, starts, ends = _row_runs(free & inside, MIN_GUTTER_WIDTH)
+    bounds = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=row_count)))).tolist()
+    runs = list(zip(starts.tolist(), ends.tolist()))
+    own_gutters = [runs[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+    # Plain ints keep the per-row comparisons below out of NumPy's scalar overhead
+    widest_cell, row_left, row_right = widest_cell.tolist(), row_left.tolist(), row_right.tolist()
+    
+    regions, region_start = [], 0
+    gaps, left, right, current = free[0], row_left[0], row_right[0], own_gutters[0]
+    
+    for row in range(1, row_count + 1):
+        # Headings always stand alone so they never get pulled into a column or table
+        if row < row_count and not standalone[row] and not standalone[row - 1]:
+            new_left, new_right = min(left, row_left[row]), max(right, row_right[row])
+            # A line spanning most of the region is running text, never a column or table row.
+            # Join only if every gutter survives and the row opens no gutters of its own
+            # elsewhere, so a table under two prose columns starts a region of its own
+            if (current and widest_cell[row] <= FULL_LINE_FRACTION * (new_right - new_left)
+                    and _runs_overlap(own_gutters[row], current)):
+                candidate = gaps & free[row]
+                joined = _gutter_runs(candidate, new_left, new_right)
+                if (len(joined) == len(current)
+                        and _runs_overlap(joined, current) and _runs_overlap(current, joined)):
+                    gaps, left, right, current = candidate, new_left, new_right, joined
+                    continue
+        
+        regions.append((region_start, row, _gutter_centres(current)))
+        if row < row_count:
+            region_start = row
+            gaps, left, right, current = free[row], row_left[row], row_right[row], own_gutters[row]
+    
+    return regions
+
+def _elements_from_lines(lines, heading_size):
+    """Merge reading-order lines and tables into heading, paragraph and table elements"""
+    elements, paragraph = [], []
+    
+    def flush_paragraph():
+        if paragraph:
+            elements.append({"type": "paragraph", "text": " ".join(paragraph)})
+            paragraph.clear()
+    
+    for line in lines:
+        if line[0] == "table":
+            flush_paragraph()
+            elements.append({"type": "table", "rows": line[1]})
+            continue
+        
+        _, text, size, new_block = line
+        if size >= heading_size:
+            flush_paragraph()
+            elements.append({"type": "heading", "text": text})
+        else:
+            if new_block:
+                flush_paragraph()
+            paragraph.append(text)
+    
+    flush_paragraph()
+    return elements
+
+def _analyse_page_layout(page):
+    """Rebuild reading order, columns and tables for one page"""
+    boxes, texts = _collect_text_cells(page)
+    if not len(boxes):
+        return {"columns": 0, "elements": []}
+    
+    # Cluster cells into rows by vertical centre, then order each row left to right
+    centres = (boxes[:, 1] + boxes[:, 3]) / 2.0
+    by_centre = np.argsort(centres, kind="stable")
+    new_row = np.concatenate(([True], np.diff(centres[by_centre]) > boxes[by_centre[1:], 4] * 0.5))
+    row_of = np.empty(len(boxes), dtype=int)
+    row_of[by_centre] = np.cumsum(new_row) - 1
+    order = np.lexsort((boxes[:, 0], row_of))
+    row_starts = np.flatnonzero(np.concatenate(([True], np.diff(row_of[order]) != 0)))
+    row_count = len(row_starts)
+    
+    row_top = np.minimum.reduceat(boxes[order, 1], row_starts)
+    row_bottom = np.maximum.reduceat(boxes[order, 3], row_starts)
+    row_size = np.maximum.reduceat(boxes[order, 4], row_starts)
+    
+    # Horizontal occupancy of every row, one cell per point of page width
+    width = int(np.ceil(page.rect.width)) + 2
+    left = np.clip(np.floor(boxes[:, 0]).astype(int), 0, width - 1)
+    right = np.clip(np.ceil(boxes[:, 2]).astype(int), 0, width - 1)
+    delta = np.zeros((row_count, width + 1))
+    np.add.at(delta, (row_of, left), 1)
+    np.add.at(delta, (row_of, right), -1)
+    occupied = np.cumsum(delta, axis=1)[:, :width] > 0
+    row_left = np.minimum.reduceat(left[order], row_starts)
+    row_right = np.maximum.reduceat(right[order], row_starts)
+    
+    row_cells = np.split(order, row_starts[1:])
+    heading_size = np.median(boxes[:, 4]) * HEADING_SIZE_FACTOR
+    lines, max_columns, previous_bottom = [], 1, None
+    
+    def add_line(text, size, top, bottom, force_break=False):
+        nonlocal previous_bottom
+        new_block = force_break or previous_bottom is None or top - previous_bottom > size * 0.8
+        lines.append(("text", text, size, new_block))
+        previous_bottom = bottom
+    
+    for first, last, gutters in _find_regions(occupied, row_left, row_right, row_size >= heading_size):
+        cells = np.concatenate(row_cells[first:last])
+        if last - first < 2 or not len(gutters):
+            for row in range(first, last):
+                add_line(" ".join(texts[i] for i in row_cells[row]), row_size[row], row_top[row], row_bottom[row])
+            continue
         
-        logger.info(f"PyPDF2 decryption complete: {successful_pages} pages processed")
-        return True
+        column = np.searchsorted(gutters, (boxes[cells, 0] + boxes[cells, 2]) / 2.0)
+        column_count = len(gutters) + 1
+        # Prose fills the space between gutters; table cells leave most of it empty
+        edges = np.concatenate(([boxes[cells, 0].min()], gutters, [boxes[cells, 2].max()]))
+        column_width = np.maximum(np.diff(edges), 1)
+        fill = (boxes[cells, 2] - boxes[cells, 0]) / column_width[column]
         
-    except Exception as e:
-        logger.error(f"PyPDF2 decryption failed: {e}")
-        return False
+        if fill.mean() >= 0.6:
+            # Prose columns: read each column top to bottom before moving right
+            max_columns = max(max_columns, column_count)
+            column_of = np.empty(len(boxes), dtype=int)
+            column_of[cells] = column
+            for col in range(column_count):
+                column_rows = row_of[cells[column == col]]
+                for position, row in enumerate(np.unique(column_rows)):
+                    in_column = row_cells[row][column_of[row_cells[row]] == col]
+                    add_line(" ".join(texts[i] for i in in_column), row_size[row],
+                             row_top[row], row_bottom[row], force_break=position == 0)
+        else:
+            # Short cells aligned on shared gutters: a table, one list per row
+            table = [[""] * column_count for _ in range(first, last)]
+            for index, col in zip(cells, column):
+                row_cells_text = table[row_of[index] - first]
+                row_cells_text[col] = (row_cells_text[col] + " " + texts[index]).strip()
+            lines.append(("table", table))
+            previous_bottom = row_bottom[last - 1]
+    
+    return {"columns": max_columns, "elements": _elements_from_lines(lines, heading_size)}
+
+def _analyse_page_range(input_file, page_numbers):
+    """Worker: analyse the layout of a range of pages (runs in a child process)"""
+    doc = fitz.open(input_file)
+    pages = [dict(page=page_number + 1, **_analyse_page_layout(doc[page_number]))
+             for page_number in page_numbers]
+    doc.close()
+    return pages
+
+def _markdown_table(rows):
+    """Render table rows as a Markdown pipe table"""
+    escape = lambda cell: cell.replace("|", "\\|")
+    lines = ["| " + " | ".join(escape(cell) for cell in rows[0]) + " |",
+             "|" + " --- |" * len(rows[0])]
+    lines += ["| " + " | ".join(escape(cell) for cell in row) + " |" for row in rows[1:]]
+    return "\n".join(lines)
+
+def _write_structured_output(pages, output_format, output_path):
+    """Write analysed pages as Markdown, CSV (tables only) or JSON"""
+    if output_format == "json":
+        with open(output_path, "w", encoding="utf-8") as f:
+            json.dump({"pages": pages}, f, ensure_ascii=False, indent=2)
+    elif output_format == "csv":
+        with open(output_path, "w", encoding="utf-8", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["page", "table", "row", "cells..."])
+            for page in pages:
+                tables = [e for e in page["elements"] if e["type"] == "table"]
+                for table_number, table in enumerate(tables, 1):
+                    for row_number, row in enumerate(table["rows"], 1):
+                        writer.writerow([page["page"], table_number, row_number] + row)
+    else:
+        with open(output_path, "w", encoding="utf-8") as f:
+            for page in pages:
+                f.write(f"<!-- Page {page['page']} -->\n\n")
+                for element in page["elements"]:
+                    if element["type"] == "heading":
+                        f.write(f"## {element['text']}\n\n")
+                    elif element["type"] == "table":
+                        f.write(_markdown_table(element["rows"]) + "\n\n")
+                    else:
+                        f.write(element["text"] + "\n\n")
 
 @safe_file_operation
-def rotate_pdf(input_file, rotation, output_file=None):
-    """Rotate pages in PDF by 90, 180, or 270 degrees"""
+def extract_structured_text(input_file, output_format="markdown", workers=None, output_file=None):
+    """Extract text in reading order with columns and tables rebuilt, as Markdown, CSV or JSON"""
     if not os.path.exists(input_file):
         logger.error(f"File not found: {input_file}")
         return False
     
-    valid_rotations = {90, 180, 270}
-    if rotation not in valid_rotations:
-        logger.error(f"Invalid rotation: {rotation}. Must be 90, 180, or 270")
+    if not NUMPY_AVAILABLE:
+        logger.error("NumPy not available - cannot run structured text extraction")
+        return False
+    
+    extension = STRUCTURED_FORMATS.get(output_format.lower())
+    if extension is None:
+        logger.error(f"Invalid output format. Must be one of: {', '.join(STRUCTURED_FORMATS)}")
         return False
     
+    # Single output file - save to main pdfs directory
     output_dir = get_single_output_dir()
-    if output_file is None:
+    unique = output_file is None
+    if unique:
         base_name = get_base_name(input_file)
-        output_file = os.path.join(output_dir, f"{base_name} ({rotation}° Rotated).pdf")
-
-    logger.info(f"Rotating {os.path.basename(input_file)} by {rotation}°")
+        suffix = "Tables" if extension == "csv" else "Structured Text"
+        output_file = os.path.join(output_dir, f"{base_name} - {suffix}.{extension}")
     
     doc = fitz.open(input_file)
-    for page in doc:
-        page.set_rotation(page.rotation + rotation)
-    
-    doc.save(output_file)
+    page_count = doc.page_count
     doc.close()
-    logger.info(f"Rotation complete: {os.path.basename(output_file)}")
-    return True
+    
+    workers = min(get_worker_count(workers), max(1, page_count // MIN_PAGES_PER_WORKER))
+    logger.info(f"Starting structured text extraction for {os.path.basename(input_file)} ({workers} workers)")
+    
+    chunks = split_into_chunks(list(range(page_count)), workers)
+    pages = [page for result in run_in_workers(_analyse_page_range, [(input_file, chunk) for chunk in chunks], workers)
+             for page in result]
+    
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        _write_structured_output(pages, extension, temp_path)
+    
+    tables = sum(1 for page in pages for element in page["elements"] if element["type"] == "table")
+    logger.info(f"Structured text extraction complete: {os.path.basename(output.path)} "
+                f"({len(pages)} pages, {tables} tables)")
+    return output.path
 
 @safe_file_operation
-def get_pdf_metadata(input_file):
-    """Get metadata from PDF"""
+def benchmark_text_extraction(input_file, output_format="markdown", workers=None):
+    """Compare structured extraction time against plain text extraction"""
     if not os.path.exists(input_file):
         logger.error(f"File not found: {input_file}")
         return None
     
-    doc = fitz.open(input_file)
-    metadata = doc.metadata
-    doc.close()
-    return metadata
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        start = time.perf_counter()
+        if not ocr_pdf(input_file, os.path.join(scratch_dir, "plain.txt")):
+            return None
+        plain_time = time.perf_counter() - start
+        
+        start = time.perf_counter()
+        if not extract_structured_text(input_file, output_format, workers,
+                                       os.path.join(scratch_dir, "structured.out")):
+            return None
+        structured_time = time.perf_counter() - start
+    
+    ratio = structured_time / plain_time if plain_time > 0 else 0.0
+    logger.info(f"Text benchmark: plain {plain_time:.3f}s, structured {structured_time:.3f}s ({ratio:.2f}x)")
+    return {"plain": plain_time, "structured": structured_time, "ratio": ratio}
+
+# Batch Job Functions
+class JobJournal:
+    """SQLite journal of completed work, used to resume interrupted batch runs"""
+    
+    def __init__(self, path=JOURNAL_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        # WAL keeps each commit cheap while still surviving a crash mid-run
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS completed (
+                job TEXT NOT NULL,
+                input_path TEXT NOT NULL,
+                item TEXT NOT NULL,
+                input_hash TEXT NOT NULL,
+                output_path TEXT,
+                finished_at TEXT NOT NULL,
+                PRIMARY KEY (job, input_path, item)
+            )"""
+        )
+        self.conn.commit()
+    
+    def is_complete(self, job, input_path, input_hash, item=""):
+        """Return True if this item finished for the same input contents and its output still exists"""
+        row = self.conn.execute(
+            "SELECT input_hash, output_path FROM completed WHERE job = ? AND input_path = ? AND item = ?",
+            (job, os.path.abspath(input_path), item)
+        ).fetchone()
+        if row is None or row[0] != input_hash:
+            return False
+        return row[1] is None or os.path.exists(row[1])
+    
+    def mark_complete(self, job, input_path, input_hash, item="", output_path=None):
+        """Record an item as finished"""
+        self.conn.execute(
+            "INSERT OR REPLACE INTO completed VALUES (?, ?, ?, ?, ?, ?)",
+            (job, os.path.abspath(input_path), item, input_hash,
+             os.path.abspath(output_path) if output_path else None,
+             datetime.now().isoformat(timespec="seconds"))
+        )
+        self.conn.commit()
+    
+    def clear(self, job):
+        """Forget all progress for a job so the next run starts from scratch"""
+        self.conn.execute("DELETE FROM completed WHERE job = ?", (job,))
+        self.conn.commit()
+    
+    def close(self):
+        self.conn.close()
+
+def run_batch(operation, input_files, job_name=None, journal_path=JOURNAL_PATH, skip_duplicates=False, **kwargs):
+    """Run an operation over many files, skipping files already completed in the journal"""
+    job_name = job_name or operation.__name__
+    if skip_duplicates:
+        input_files = unique_files(input_files)
+    journal = JobJournal(journal_path)
+    # split_pdf journals each page itself, so an interrupted file resumes mid-way and a
+    # deleted page is rebuilt; a file-level entry would skip the file once any run finished
+    per_item = operation is split_pdf
+    if per_item:
+        kwargs["journal"] = journal
+        kwargs["job_name"] = job_name
+    
+    completed = skipped = failed = 0
+    logger.info(f"Starting batch '{job_name}' over {len(input_files)} files")
+    
+    try:
+        for i, input_file in enumerate(input_files):
+            if not os.path.exists(input_file):
+                logger.error(f"File not found: {input_file}")
+                failed += 1
+                continue
+            
+            input_hash = file_hash(input_file)
+            if not per_item and journal.is_complete(job_name, input_file, input_hash):
+                skipped += 1
+                continue
+            
+            logger.info(f"Batch '{job_name}' {i+1}/{len(input_files)}: {os.path.basename(input_file)}")
+            # Operations return their output path, so a deleted output is redone on the next run
+            result = operation(input_file, **kwargs)
+            if result:
+                if not per_item:
+                    output_path = result if isinstance(result, str) else None
+                    journal.mark_complete(job_name, input_file, input_hash, output_path=output_path)
+                completed += 1
+            else:
+                failed += 1
+    finally:
+        journal.close()
+    
+    logger.info(f"Batch '{job_name}' complete: {completed} processed, {skipped} skipped, {failed} failed")
+    return {"completed": completed, "skipped": skipped, "failed": failed}
+
+# Duplicate Detection Functions
+DEDUP_INDEX_PATH = os.path.join(LOGS_DIR, "dedup_index.sqlite3")
+MINHASH_PERMUTATIONS = 64
+MINHASH_BANDS = 16          # 16 bands of 4 rows: pairs above ~0.6 similarity almost always collide
+SHINGLE_WORDS = 5
+MINHASH_PRIME = 4294967311  # smallest prime above 2**32, so (a * x + b) fits in uint64
+DHASH_DPI = 72
+LSH_MAX_BUCKET = 50         # larger buckets (e.g. blank margins) are chained, not paired all-to-all
+FINGERPRINT_VERSION = 2     # bump when fingerprints change so existing indexes are rebuilt
+
+def _minhash_parameters():
+    """Return the fixed (a, b) coefficients of the MinHash permutations"""
+    rng = np.random.default_rng(0x5EED)
+    a = rng.integers(1, 2**32, MINHASH_PERMUTATIONS, dtype=np.uint64)
+    b = rng.integers(0, 2**32, MINHASH_PERMUTATIONS, dtype=np.uint64)
+    return a, b
+
+def _text_minhash(text, params):
+    """Return the MinHash signature of a page's word shingles, or None for pages without text"""
+    words = re.findall(r"\w+", text.lower())
+    if not words:
+        return None
+    shingles = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    hashes = np.fromiter((zlib.crc32(s.encode("utf-8")) for s in shingles), dtype=np.uint64, count=len(shingles))
+    a, b = params
+    return ((np.outer(hashes, a) + b) % MINHASH_PRIME).min(axis=0)
+
+def _page_dhash(page):
+    """Return a 64-bit difference hash of the page, from a greyscale render averaged down to 9x8"""
+    rect = page.rect
+    zoom = max(DHASH_DPI / 72, 9 / rect.width, 8 / rect.height)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csGRAY, alpha=False)
+    pixels = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.stride)[:, :pix.width].astype(float)
+    
+    # Box-average into 8 rows of 9 cells; sampling a 9x8 render directly misses thin
+    # text strokes, turning every text page white and every hash 0
+    row_edges = np.linspace(0, pix.height, 9).astype(int)
+    col_edges = np.linspace(0, pix.width, 10).astype(int)
+    sums = np.add.reduceat(np.add.reduceat(pixels, row_edges[:-1], axis=0), col_edges[:-1], axis=1)
+    cells = sums / np.outer(np.diff(row_edges), np.diff(col_edges))
+    bits = (cells[:, 1:] > cells[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+def _fingerprint_files(paths):
+    """Worker: hash files and fingerprint their pages (runs in a child process)"""
+    params = _minhash_parameters()
+    results = []
+    
+    for path in paths:
+        try:
+            stat = os.stat(path)
+            doc = fitz.open(path)
+            pages = []
+            for page in doc:
+                signature = _text_minhash(page.get_text(), params)
+                pages.append((signature.tobytes() if signature is not None else None, _page_dhash(page)))
+            doc.close()
+            results.append((path, file_hash(path), stat.st_size, stat.st_mtime_ns, pages))
+        except Exception as e:
+            logger.warning(f"Failed to fingerprint {path}: {e}")
+    
+    return results
+
+class DuplicateIndex:
+    """SQLite store of file hashes and page fingerprints, refreshed only for changed files"""
+    
+    def __init__(self, path=DEDUP_INDEX_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # Fingerprints from an older version are not comparable with new ones
+        if self.conn.execute("PRAGMA user_version").fetchone()[0] != FINGERPRINT_VERSION:
+            self.conn.execute("DROP TABLE IF EXISTS files")
+            self.conn.execute("DROP TABLE IF EXISTS pages")
+            self.conn.execute(f"PRAGMA user_version = {FINGERPRINT_VERSION}")
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS files (
+                path TEXT PRIMARY KEY,
+                sha256 TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                mtime_ns INTEGER NOT NULL
+            )"""
+        )
+        self.conn.execute(
+            """CREATE TABLE IF NOT EXISTS pages (
+                path TEXT NOT NULL,
+                page INTEGER NOT NULL,
+                minhash BLOB,
+                dhash TEXT NOT NULL,
+                PRIMARY KEY (path, page)
+            )"""
+        )
+        self.conn.commit()
+    
+    def stale_files(self, paths):
+        """Return the paths that are new or changed since they were last indexed"""
+        known = {row[0]: (row[1], row[2]) for row in self.conn.execute("SELECT path, size, mtime_ns FROM files")}
+        stale = []
+        for path in paths:
+            stat = os.stat(path)
+            if known.get(os.path.abspath(path)) != (stat.st_size, stat.st_mtime_ns):
+                stale.append(path)
+        return stale
+    
+    def store(self, results):
+        """Insert or replace fingerprints produced by _fingerprint_files"""
+        with self.conn:
+            for path, sha256, size, mtime_ns, pages in results:
+                path = os.path.abspath(path)
+                self.conn.execute("DELETE FROM pages WHERE path = ?", (path,))
+                self.conn.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)", (path, sha256, size, mtime_ns))
+                self.conn.executemany(
+                    "INSERT INTO pages VALUES (?, ?, ?, ?)",
+                    [(path, i + 1, minhash, f"{dhash:016x}") for i, (minhash, dhash) in enumerate(pages)]
+                )
+    
+    def prune(self, paths):
+        """Drop entries for files that no longer exist under the indexed tree"""
+        keep = {os.path.abspath(path) for path in paths}
+        removed = [row[0] for row in self.conn.execute("SELECT path FROM files") if row[0] not in keep]
+        with self.conn:
+            for path in removed:
+                self.conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                self.conn.execute("DELETE FROM pages WHERE path = ?", (path,))
+    
+    def files(self):
+        return self.conn.execute("SELECT path, sha256 FROM files").fetchall()
+    
+    def sha256(self, path):
+        """Return a file's indexed SHA-256, or None if it is not indexed or has changed since"""
+        row = self.conn.execute(
+            "SELECT sha256, size, mtime_ns FROM files WHERE path = ?", (os.path.abspath(path),)
+        ).fetchone()
+        stat = os.stat(path)
+        if row is None or (row[1], row[2]) != (stat.st_size, stat.st_mtime_ns):
+            return None
+        return row[0]
+    
+    def pages(self):
+        return self.conn.execute("SELECT path, page, minhash, dhash FROM pages").fetchall()
+    
+    def close(self):
+        self.conn.close()
+
+def _find_pdf_files(root):
+    """Return every PDF under root, in a stable order"""
+    pdf_files = []
+    for dirpath, dirs, files in os.walk(root):
+        dirs.sort()
+        pdf_files.extend(os.path.join(dirpath, f) for f in sorted(files) if f.lower().endswith(".pdf"))
+    return pdf_files
+
+def _cluster_pairs(count, pairs):
+    """Union-find over item indices; return clusters with more than one member"""
+    parent = list(range(count))
+    
+    def find(i):
+        while parent[i] != i:
+            parent[i] = parent[parent[i]]
+            i = parent[i]
+        return i
+    
+    for i, j in pairs:
+        parent[find(i)] = find(j)
+    
+    clusters = {}
+    for i in range(count):
+        clusters.setdefault(find(i), []).append(i)
+    return [members for members in clusters.values() if len(members) > 1]
+
+def _candidate_pairs(keys_per_item, max_bucket=LSH_MAX_BUCKET):
+    """Return index pairs that share at least one LSH bucket key"""
+    buckets = {}
+    for i, keys in enumerate(keys_per_item):
+        for key in keys:
+            buckets.setdefault(key, []).append(i)
+    
+    pairs = set()
+    for members in buckets.values():
+        if len(members) > max_bucket:
+            # A key this common carries little signal; pairing neighbours keeps the cost
+            # linear while a genuine duplicate cluster still links up through the chain
+            pairs.update(zip(members, members[1:]))
+            continue
+        for position, i in enumerate(members):
+            for j in members[position + 1:]:
+                pairs.add((i, j))
+    return pairs
 
 @safe_file_operation
-def set_pdf_metadata(input_file, metadata, output_file=None):
-    """Set metadata for PDF"""
-    if not os.path.exists(input_file):
-        logger.error(f"File not found: {input_file}")
+def build_duplicate_index(root=INPUT_DIR, workers=None, index_path=DEDUP_INDEX_PATH):
+    """Fingerprint new or changed PDFs under root in parallel and store them in the index"""
+    if not NUMPY_AVAILABLE:
+        logger.error("NumPy not available - cannot fingerprint PDFs")
         return False
     
-    output_dir = get_single_output_dir()
-    if output_file is None:
-        base_name = get_base_name(input_file)
-        output_file = os.path.join(output_dir, f"{base_name} (Metadata Updated).pdf")
+    pdf_files = _find_pdf_files(root)
+    index = DuplicateIndex(index_path)
+    try:
+        index.prune(pdf_files)
+        stale = index.stale_files(pdf_files)
+        workers = get_worker_count(workers)
+        logger.info(f"Fingerprinting {len(stale)} of {len(pdf_files)} PDFs ({workers} workers)")
+        
+        jobs = [(chunk,) for chunk in split_into_chunks(stale, workers * 4)]
+        for results in run_in_workers(_fingerprint_files, jobs, workers):
+            index.store(results)
+    finally:
+        index.close()
+    
+    logger.info("Duplicate index up to date")
+    return True
 
-    logger.info(f"Updating metadata for {os.path.basename(input_file)}")
+@safe_file_operation
+def find_duplicates(root=INPUT_DIR, text_threshold=0.8, image_distance=3, workers=None,
+                    index_path=DEDUP_INDEX_PATH, output_file=None):
+    """Report exact duplicate files and near-duplicate page clusters under root"""
+    if not build_duplicate_index(root, workers, index_path):
+        return None
     
-    doc = fitz.open(input_file)
-    if metadata.get('title'):
-        doc.set_metadata({'/Title': metadata['title']})
-    if metadata.get('author'):
-        doc.set_metadata({'/Author': metadata['author']})
-    if metadata.get('subject'):
-        doc.set_metadata({'/Subject': metadata['subject']})
-    if metadata.get('creator'):
-        doc.set_metadata({'/Creator': metadata['creator']})
-    if metadata.get('producer'):
-        doc.set_metadata({'/Producer': metadata['producer']})
+    unique = output_file is None
+    if unique:
+        output_file = os.path.join(get_single_output_dir(), "Duplicate Report.json")
     
-    doc.save(output_file)
-    doc.close()
-    logger.info(f"Metadata update complete: {os.path.basename(output_file)}")
-    return True
+    index = DuplicateIndex(index_path)
+    try:
+        files, pages = index.files(), index.pages()
+    finally:
+        index.close()
+    
+    # Exact duplicates: identical content hashes
+    by_hash = {}
+    for path, sha256 in files:
+        by_hash.setdefault(sha256, []).append(path)
+    exact = [sorted(paths) for paths in by_hash.values() if len(paths) > 1]
+    
+    # Pages inside exact duplicate files are already reported, so compare one copy only
+    duplicate_copies = {path for paths in exact for path in paths[1:]}
+    pages = [page for page in pages if page[0] not in duplicate_copies]
+    signatures = [np.frombuffer(page[2], dtype=np.uint64) if page[2] else None for page in pages]
+    dhashes = [int(page[3], 16) for page in pages]
+    
+    # Blank pages (no text, flat render) would all match each other, so leave them out
+    live = [i for i in range(len(pages)) if signatures[i] is not None or dhashes[i] != 0]
+    
+    # LSH keys: MinHash bands for text, and dHash chunks for renders. Two hashes within
+    # image_distance bits must agree on at least one of image_distance + 1 chunks.
+    rows = MINHASH_PERMUTATIONS // MINHASH_BANDS
+    chunk_count = image_distance + 1
+    chunk_bits = 64 // chunk_count
+    keys = []
+    for i in live:
+        item_keys = [("d", c, (dhashes[i] >> (c * chunk_bits)) & ((1 << chunk_bits) - 1)) for c in range(chunk_count)]
+        if signatures[i] is not None:
+            item_keys += [("t", band, signatures[i][band * rows:(band + 1) * rows].tobytes())
+                          for band in range(MINHASH_BANDS)]
+        keys.append(item_keys)
+    
+    confirmed = []
+    for a, b in _candidate_pairs(keys):
+        i, j = live[a], live[b]
+        if bin(dhashes[i] ^ dhashes[j]).count("1") > image_distance:
+            continue
+        if signatures[i] is not None and signatures[j] is not None:
+            if np.mean(signatures[i] == signatures[j]) < text_threshold:
+                continue
+        elif signatures[i] is not None or signatures[j] is not None:
+            continue
+        confirmed.append((a, b))
+    
+    near = [[{"file": pages[live[m]][0], "page": pages[live[m]][1]}
+             for m in sorted(members, key=lambda m: pages[live[m]][:2])]
+            for members in _cluster_pairs(len(live), confirmed)]
+    
+    report = {"exact_duplicate_files": exact, "near_duplicate_pages": near}
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        with open(temp_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    
+    logger.info(f"Duplicate scan complete: {len(exact)} duplicate file groups, "
+                f"{len(near)} near-duplicate page clusters across {len(live)} pages")
+    # The report name may carry a " (n)" suffix, so callers get the path actually written
+    return dict(report, report_file=output.path)
+
+def unique_files(paths, index_path=DEDUP_INDEX_PATH):
+    """Drop files whose contents exactly match an earlier file in the list"""
+    index = DuplicateIndex(index_path)
+    seen, unique = set(), []
+    try:
+        for path in paths:
+            if not os.path.exists(path):
+                unique.append(path)
+                continue
+            # Reuse the duplicate index's hash when the file is unchanged since it was indexed
+            digest = index.sha256(path) or file_hash(path)
+            if digest in seen:
+                logger.info(f"Skipping duplicate: {os.path.basename(path)}")
+                continue
+            seen.add(digest)
+            unique.append(path)
+    finally:
+        index.close()
+    return unique
+
+# Form Filling Functions
+CHECKED_VALUES = {"1", "true", "yes", "on", "x", "checked"}
+
+def _compile_form_fields(doc):
+    """Scan a template's widgets once and map field name -> [(page, xref, type, on state)]"""
+    field_map = {}
+    for page in doc:
+        for widget in page.widgets():
+            on_state = widget.on_state() if widget.field_type in (
+                fitz.PDF_WIDGET_TYPE_CHECKBOX, fitz.PDF_WIDGET_TYPE_RADIOBUTTON) else None
+            field_map.setdefault(widget.field_name, []).append(
+                (page.number, widget.xref, widget.field_type, on_state))
+    return field_map
+
+def _fill_form_fields(doc, field_map, row, flatten):
+    """Fill an opened copy of the template in place, loading each widget straight from its xref"""
+    pages = {}  # widgets are only valid while their page object is alive
+    for name, value in row.items():
+        entries = field_map.get(name, ())
+        text = "" if value is None else str(value).strip()
+        # A radio group's value names one button. Only that button is set: PyMuPDF turns the
+        # rest of the group off, whereas setting a button to "Off" would switch it on
+        radio_choice = next((on_state for _, _, field_type, on_state in entries
+                             if field_type == fitz.PDF_WIDGET_TYPE_RADIOBUTTON
+                             and text.lower() == str(on_state).lower()), None)
+        for page_number, xref, field_type, on_state in entries:
+            if field_type == fitz.PDF_WIDGET_TYPE_RADIOBUTTON and radio_choice not in (None, on_state):
+                continue
+            if page_number not in pages:
+                pages[page_number] = doc[page_number]
+            widget = pages[page_number].load_widget(xref)
+            if field_type == fitz.PDF_WIDGET_TYPE_RADIOBUTTON:
+                widget.field_value = on_state if radio_choice is not None else False
+            elif on_state is not None:
+                widget.field_value = on_state if text.lower() in CHECKED_VALUES else "Off"
+            else:
+                widget.field_value = "" if value is None else str(value)
+            widget.update()
+    
+    if flatten:
+        doc.bake(annots=False, widgets=True)
+
+def _form_output_name(base_name, row, row_number, filename_field):
+    """Return the output filename for one filled row"""
+    label = str(row.get(filename_field, "")).strip() if filename_field else ""
+    label = re.sub(r'[<>:"/\\|?*]', "_", label) or f"Row {row_number}"
+    return f"{base_name} - {label}.pdf"
+
+def _fill_form_rows(template_bytes, field_map, rows, first_row, flatten, merge, output_dir, base_name,
+                    filename_field):
+    """Worker: fill a chunk of rows into separate files, or one merged chunk (runs in a child process)"""
+    merged = fitz.open() if merge else None
+    # Each row opens its own copy of the template bytes; time the stages so benchmarks show that cost
+    timings = {"open": 0.0, "fill": 0.0, "save": 0.0}
+    failures = 0
+    for offset, row in enumerate(rows):
+        row_number = first_row + offset
+        try:
+            start = time.perf_counter()
+            doc = fitz.open("pdf", template_bytes)
+            opened = time.perf_counter()
+            _fill_form_fields(doc, field_map, row, flatten)
+            filled = time.perf_counter()
+            if merge:
+                merged.insert_pdf(doc)
+            else:
+                output_name = _form_output_name(base_name, row, row_number, filename_field)
+                # Rows that share a filename field value each get their own " (n)" file
+                with atomic_output(os.path.join(output_dir, output_name), unique=True) as temp_path:
+                    doc.save(temp_path, garbage=1, deflate=True)
+            doc.close()
+        except Exception as e:
+            # One bad row should not cost the rest of the chunk
+            logger.error(f"Error filling CSV row {row_number}: {e}", exc_info=True)
+            failures += 1
+            continue
+        timings["open"] += opened - start
+        timings["fill"] += filled - opened
+        timings["save"] += time.perf_counter() - filled
+    
+    if merge:
+        # A document with no pages cannot be saved, so a chunk whose rows all failed sends nothing
+        chunk = merged.tobytes(garbage=1, deflate=True) if merged.page_count else None
+        merged.close()
+        return chunk, timings, failures
+    return len(rows) - failures, timings, failures
 
 @safe_file_operation
-def compress_pdf(input_file, compression_level=6, output_file=None):
-    """Compress PDF to reduce file size"""
-    if not os.path.exists(input_file):
-        logger.error(f"File not found: {input_file}")
+def fill_form(template_file, values, flatten=False, output_file=None):
+    """Fill one copy of a PDF form from a dict of field values"""
+    if not os.path.exists(template_file):
+        logger.error(f"File not found: {template_file}")
         return False
     
-    if not 0 <= compression_level <= 9:
-        compression_level = 6
-    
     output_dir = get_single_output_dir()
-    if output_file is None:
-        base_name = get_base_name(input_file)
-        output_file = os.path.join(output_dir, f"{base_name} (Compressed).pdf")
-
-    logger.info(f"Compressing {os.path.basename(input_file)} (level {compression_level})")
+    unique = output_file is None
+    if unique:
+        base_name = get_base_name(template_file)
+        output_file = os.path.join(output_dir, f"{base_name} (Filled).pdf")
     
-    doc = fitz.open(input_file)
-    doc.save(
-        output_file,
-        garbage=4,
-        deflate=True,
-        compression=compression_level,
-        clean=True
-    )
+    with open(template_file, "rb") as f:
+        template_bytes = f.read()
+    template = fitz.open("pdf", template_bytes)
+    field_map = _compile_form_fields(template)
+    template.close()
+    
+    unknown = set(values) - set(field_map)
+    if unknown:
+        logger.warning(f"Ignoring unknown form fields: {', '.join(sorted(unknown))}")
+    
+    doc = fitz.open("pdf", template_bytes)
+    _fill_form_fields(doc, field_map, values, flatten)
+    output = atomic_output(output_file, unique)
+    with output as temp_path:
+        doc.save(temp_path, garbage=1, deflate=True)
     doc.close()
+    logger.info(f"Form fill complete: {os.path.basename(output.path)}")
+    return output.path
+
+def _fill_forms(template_file, csv_file, flatten, merge, filename_field, workers, output_file):
+    """Fill a form once per CSV row; return (output, per-stage seconds, rows, failed rows) or None"""
+    for path in (template_file, csv_file):
+        if not os.path.exists(path):
+            logger.error(f"File not found: {path}")
+            return None
     
-    original_size = os.path.getsize(input_file)
-    compressed_size = os.path.getsize(output_file)
-    ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
-    logger.info(f"Compression complete: {ratio:.1f}% size reduction")
-    return True
+    with open(csv_file, newline="", encoding="utf-8-sig") as f:
+        rows = list(csv.DictReader(f))
+    if not rows:
+        logger.error(f"No rows found in {os.path.basename(csv_file)}")
+        return None
+    
+    # Compile the field map once; workers get it with the template bytes, so no copy scans widgets
+    with open(template_file, "rb") as f:
+        template_bytes = f.read()
+    template = fitz.open("pdf", template_bytes)
+    field_map = _compile_form_fields(template)
+    template.close()
+    
+    unknown = set(rows[0]) - set(field_map)
+    if unknown:
+        logger.warning(f"Ignoring CSV columns with no matching form field: {', '.join(sorted(unknown))}")
+    
+    if merge and not flatten:
+        # Every copy shares the same field names, which would tie their values together
+        logger.info("Flattening forms for the merged output so copies keep their own values")
+        flatten = True
+    
+    base_name = get_base_name(template_file)
+    if merge:
+        output_dir = None
+        unique = output_file is None
+        if unique:
+            output_file = os.path.join(get_single_output_dir(), f"{base_name} (Filled).pdf")
+    else:
+        # Multiple output files - use subdirectory
+        output_dir = get_output_subdir(template_file)
+    
+    workers = get_worker_count(workers)
+    logger.info(f"Filling {len(rows)} copies of {os.path.basename(template_file)} "
+                f"({len(field_map)} fields, {workers} workers)")
+    
+    chunks, first_row = [], 1
+    for chunk in split_into_chunks(rows, workers * 4):
+        chunks.append((template_bytes, field_map, chunk, first_row, flatten, merge, output_dir, base_name,
+                       filename_field))
+        first_row += len(chunk)
+    results, chunk_timings, chunk_failures = zip(*run_in_workers(_fill_form_rows, chunks, workers))
+    timings = {stage: sum(t[stage] for t in chunk_timings) for stage in chunk_timings[0]}
+    failures = sum(chunk_failures)
+    if failures:
+        logger.error(f"{failures} of {len(rows)} CSV rows could not be filled")
+    
+    if merge:
+        parts = [chunk for chunk in results if chunk]
+        if not parts:
+            return None
+        merged = fitz.open()
+        for chunk in parts:
+            part = fitz.open("pdf", chunk)
+            merged.insert_pdf(part)
+            part.close()
+        output = atomic_output(output_file, unique)
+        with output as temp_path:
+            merged.save(temp_path, garbage=3, deflate=True)
+        merged.close()
+        logger.info(f"Form fill complete: {len(rows) - failures} forms merged into {os.path.basename(output.path)}")
+        return output.path, timings, len(rows), failures
+    
+    logger.info(f"Form fill complete: {sum(results)} forms created")
+    return output_dir, timings, len(rows), failures
+
+@safe_file_operation
+def fill_forms_from_csv(template_file, csv_file, flatten=False, merge=False, filename_field=None,
+                        workers=None, output_file=None):
+    """Fill a PDF form once per CSV row, as separate files or a single merged PDF"""
+    result = _fill_forms(template_file, csv_file, flatten, merge, filename_field, workers, output_file)
+    if result is None:
+        return False
+    output, _, _, failures = result
+    # Like batch stamping, the run only counts as a success if every row was filled
+    return output if not failures else False
+
+@safe_file_operation
+def benchmark_form_fill(template_file, csv_file, flatten=False, merge=False, workers=None):
+    """Measure forms per second, and the per-form time spent opening, filling and saving copies"""
+    with tempfile.TemporaryDirectory() as scratch_dir:
+        # Route outputs to a scratch run directory so benchmarks never touch ./pdfs
+        previous_run_dir = _run_output_dir
+        start_run(scratch_dir)
+        try:
+            start = time.perf_counter()
+            result = _fill_forms(template_file, csv_file, flatten, merge, None, workers, None)
+            elapsed = time.perf_counter() - start
+        finally:
+            if previous_run_dir:
+                start_run(previous_run_dir)
+            else:
+                end_run()
+    
+    if result is None:
+        return None
+    _, timings, row_count, failures = result
+    if failures:
+        return None
+    
+    results = {
+        "forms": row_count,
+        "seconds": elapsed,
+        "forms_per_second": row_count / elapsed if elapsed > 0 else 0.0,
+    }
+    # Summed over all workers, so these are CPU-side costs per form rather than wall-clock shares
+    for stage, seconds in timings.items():
+        results[f"{stage}_ms_per_form"] = seconds * 1000 / row_count
+    logger.info(f"Form fill benchmark: {results['forms_per_second']:.1f} forms/s over {row_count} rows "
+                f"(per form: open {results['open_ms_per_form']:.2f} ms, fill {results['fill_ms_per_form']:.2f} ms, "
+                f"save {results['save_ms_per_form']:.2f} ms)")
+    return results
 
 class PDFToolGUI:
     """Main GUI application for PDF manipulation tools"""
@@ -532,19 +2652,27 @@ class PDFToolGUI:
             ("Rotate", self._rotate_pdf),
             ("Merge", self._merge_pdfs),
             ("Text", self._extract_text),
+            ("Structured Text", self._extract_structured_text),
             ("Decrypt", self._decrypt_pdf),
             ("Compress", self._compress_pdf),
+            ("Optimize", self._optimize_pdf),
             ("Metadata", self._edit_metadata),
+            ("Stamp", self._stamp_pdf),
+            ("Fill Forms", self._fill_forms),
+            ("Images", self._export_images),
+            ("Duplicates", self._find_duplicates),
             ("Refresh", self.refresh_file_list)
         ]
 
-        for text, command in buttons:
+        # Lay buttons out in rows so the panel fits the window as operations are added
+        buttons_per_row = 6
+        for i, (text, command) in enumerate(buttons):
             cctk.CTkButton(
                 button_frame,
                 text=text,
                 command=command,
                 width=100
-            ).pack(side="left", padx=5, pady=10)
+            ).grid(row=i // buttons_per_row, column=i % buttons_per_row, padx=5, pady=5)
 
     def _bind_shortcuts(self):
         """Bind keyboard shortcuts"""
@@ -630,7 +2758,7 @@ class PDFToolGUI:
     def _split_pdf(self):
         """Handle PDF splitting operation"""
         pdf_path = self._get_selected_file()
-        if pdf_path and split_pdf(pdf_path):
+        if pdf_path and split_pdf(pdf_path, preserve_structure=True):
             self._show_success_and_refresh("PDF split successfully.")
 
     def _delete_page(self):
@@ -690,6 +2818,27 @@ class PDFToolGUI:
         if pdf_path and ocr_pdf(pdf_path):
             self._show_success_and_refresh("Text extraction complete.")
 
+    def _extract_structured_text(self):
+        """Handle layout-preserving text extraction"""
+        pdf_path = self._get_selected_file()
+        if not pdf_path:
+            return
+        
+        output_format = CTkInputDialog(
+            title="Structured Text",
+            text="Enter output format (markdown, csv, json - default markdown):"
+        ).get_input()
+        if output_format is None:
+            return
+        
+        output_format = output_format.strip().lower() or "markdown"
+        if output_format not in STRUCTURED_FORMATS:
+            messagebox.showerror("Error", "Please enter markdown, csv, or json.")
+            return
+        
+        if extract_structured_text(pdf_path, output_format):
+            self._show_success_and_refresh("Structured text extraction complete.")
+
     def _decrypt_pdf(self):
         """Handle PDF decryption operation"""
         pdf_path = self._get_selected_file()
@@ -742,6 +2891,69 @@ class PDFToolGUI:
         if compress_pdf(pdf_path, compression_level):
             self._show_success_and_refresh("PDF compressed successfully.")
 
+    def _export_images(self):
+        """Handle page rendering and embedded image extraction"""
+        pdf_path = self._get_selected_file()
+        if not pdf_path:
+            return
+        
+        dpi = CTkInputDialog(
+            title="Export Images",
+            text="Enter render DPI (default 150):"
+        ).get_input()
+        if dpi is None:
+            return
+        
+        try:
+            dpi = int(dpi) if dpi else 150
+        except ValueError:
+            messagebox.showerror("Error", "Please enter a valid number.")
+            return
+        
+        image_format = CTkInputDialog(
+            title="Export Images",
+            text="Enter image format (png, jpeg, webp - default png):"
+        ).get_input()
+        if image_format is None:
+            return
+        
+        image_format = image_format.strip().lower() or "png"
+        if image_format not in IMAGE_FORMATS:
+            messagebox.showerror("Error", "Please enter png, jpeg, or webp.")
+            return
+        
+        self._set_status("Exporting images...")
+        if render_pdf_pages(pdf_path, dpi, image_format) and extract_pdf_images(pdf_path):
+            self._show_success_and_refresh("Images exported successfully.")
+
+    def _find_duplicates(self):
+        """Handle duplicate scan across the whole pdfs directory"""
+        self._set_status("Scanning for duplicates...")
+        report = find_duplicates()
+        if not report:
+            messagebox.showerror("Error", "Duplicate scan failed. Check the logs for more details.")
+            return
+        
+        self._show_success_and_refresh(
+            f"Found {len(report['exact_duplicate_files'])} groups of identical PDFs and "
+            f"{len(report['near_duplicate_pages'])} clusters of near-duplicate pages.\n\n"
+            f"Details saved to {os.path.basename(report['report_file'])}."
+        )
+
+    def _optimize_pdf(self):
+        """Handle web optimization operation"""
+        pdf_path = self._get_selected_file()
+        if not pdf_path:
+            return
+        
+        linearize = messagebox.askyesno(
+            "Optimize PDF",
+            "Linearize for fast web view?\n(Object streams, font subsetting and unused resource removal always apply)"
+        )
+        
+        if optimize_pdf(pdf_path, linearize=linearize):
+            self._show_success_and_refresh("PDF optimized successfully.")
+
     def _edit_metadata(self):
         """Handle metadata editing operation"""
         pdf_path = self._get_selected_file()
@@ -793,6 +3005,75 @@ class PDFToolGUI:
         
         cctk.CTkButton(dialog, text="Save", command=save_metadata).pack(pady=20)
 
+    def _stamp_pdf(self):
+        """Handle watermark, Bates numbering and redaction operation"""
+        pdf_path = self._get_selected_file()
+        if not pdf_path:
+            return
+        
+        watermark_text = CTkInputDialog(
+            title="Stamp PDF",
+            text="Enter watermark text (leave blank for none):"
+        ).get_input()
+        if watermark_text is None:
+            return
+        
+        bates_prefix = CTkInputDialog(
+            title="Stamp PDF",
+            text="Enter Bates number prefix (leave blank for no Bates numbers):"
+        ).get_input()
+        if bates_prefix is None:
+            return
+        
+        redact_pattern = CTkInputDialog(
+            title="Stamp PDF",
+            text="Enter a regular expression to redact (leave blank for none):"
+        ).get_input()
+        if redact_pattern is None:
+            return
+        
+        try:
+            redact_patterns = [redact_pattern] if redact_pattern else None
+            if redact_patterns:
+                re.compile(redact_pattern)
+        except re.error:
+            messagebox.showerror("Error", "Please enter a valid regular expression.")
+            return
+        
+        if not (watermark_text or bates_prefix or redact_patterns):
+            messagebox.showerror("Error", "Enter a watermark, Bates prefix or redaction pattern.")
+            return
+        
+        if stamp_pdf(pdf_path, watermark_text or None, bates_prefix=bates_prefix or None,
+                     redact_patterns=redact_patterns):
+            self._show_success_and_refresh("PDF stamped successfully.")
+
+    def _fill_forms(self):
+        """Handle bulk form filling from a CSV file"""
+        pdf_path = self._get_selected_file()
+        if not pdf_path:
+            return
+        
+        csv_path = CTkInputDialog(
+            title="Fill Forms",
+            text="Enter the path of the CSV file (one form per row, headers are field names):"
+        ).get_input()
+        if not csv_path:
+            return
+        
+        csv_path = csv_path.strip().strip('"')
+        if not os.path.isfile(csv_path):
+            messagebox.showerror("Error", f"CSV file not found: {csv_path}")
+            return
+        
+        flatten = messagebox.askyesno(
+            "Fill Forms",
+            "Flatten the filled forms so the values can no longer be edited?"
+        )
+        
+        if fill_forms_from_csv(pdf_path, csv_path, flatten=flatten):
+            self._show_success_and_refresh("Forms filled successfully.")
+
     def _merge_pdfs(self):
         """Handle multi-PDF merge operation"""
         self._set_status("Select PDFs to merge...")
@@ -846,7 +3127,7 @@ class PDFToolGUI:
             if len(selected_pdfs) < 2:
                 messagebox.showerror("Error", "Select at least 2 PDFs.")
                 return
-            if perform_multi_merge(selected_pdfs):
+            if perform_multi_merge(selected_pdfs, preserve_structure=True):
                 messagebox.showinfo("Success", f"Merged {len(selected_pdfs)} PDFs.")
                 dialog.destroy()
                 self.refresh_file_list()
@@ -869,6 +3150,20 @@ class PDFToolGUI:
 # Main Application Entry Point
 def main():
     """Initialize and run the PDFinator application"""
+    parser = argparse.ArgumentParser(description="The PDFinator")
+    parser.add_argument("--profile", action="store_true",
+                        help=f"profile every operation (same as {PROFILE_ENV}=1)")
+    parser.add_argument("--profile-report", action="store_true",
+                        help="print the slowest inputs and hottest call sites from saved profiles, then exit")
+    parser.add_argument("--top", type=int, default=10, help="rows to show in the profile report")
+    args = parser.parse_args()
+    
+    if args.profile_report:
+        print(profile_report(top=args.top))
+        return
+    if args.profile:
+        enable_profiling()
+    
     root = cctk.CTk()
     app = PDFToolGUI(root)
     root.mainloop()
@@ -29,6 +29,15 @@ pip install pycryptodome
 echo Installing customtkinter...
 pip install customtkinter
 
+echo Installing Pillow...
+pip install Pillow
+
+echo Installing numpy...
+pip install numpy
+
+echo Installing pikepdf...
+pip install pikepdf
+
 echo.
 echo ========================================
 echo Installation complete!
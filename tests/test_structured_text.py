@@ -0,0 +1,62 @@
+"""Regression tests for layout grouping in structured text extraction"""
+
+import json
+
+import pytest
+
+fitz = pytest.importorskip("fitz")
+pytest.importorskip("numpy")
+PDFinator = pytest.importorskip("PDFinator")
+
+PROSE = ("The quick brown fox jumps over the lazy dog while the committee reviews the "
+         "quarterly figures and drafts a summary for the board meeting next week. ")
+TABLE = [["Name", "Qty", "Price"], ["Apple", "3", "1.20"], ["Banana", "12", "0.40"], ["Cherry", "200", "9.99"]]
+
+
+def add_prose(page, top, x0=72, x1=540):
+    page.insert_textbox(fitz.Rect(x0, top, x1, top + 200), PROSE, fontsize=10)
+
+
+def add_table(page, top, columns=(72, 200, 330)):
+    for row_number, row in enumerate(TABLE):
+        for x, cell in zip(columns, row):
+            page.insert_text((x, top + row_number * 16), cell, fontsize=10)
+
+
+def extract(tmp_path, build):
+    pdf_path = tmp_path / "layout.pdf"
+    doc = fitz.open()
+    build(doc.new_page())
+    doc.save(pdf_path)
+    doc.close()
+    
+    output_path = tmp_path / "layout.json"
+    assert PDFinator.extract_structured_text(str(pdf_path), "json", workers=1, output_file=str(output_path))
+    with open(output_path, encoding="utf-8") as f:
+        return json.load(f)["pages"][0]
+
+
+def test_table_between_full_width_paragraphs(tmp_path):
+    def build(page):
+        add_prose(page, 72)
+        add_table(page, 112)
+        add_prose(page, 172)
+    
+    page = extract(tmp_path, build)
+    
+    assert [element["type"] for element in page["elements"]] == ["paragraph", "table", "paragraph"]
+    assert page["elements"][1]["rows"] == TABLE
+
+
+def test_table_directly_under_two_columns(tmp_path):
+    def build(page):
+        add_prose(page, 72, 72, 290)
+        add_prose(page, 72, 322, 540)
+        add_table(page, 195)
+    
+    page = extract(tmp_path, build)
+    
+    assert page["columns"] == 2
+    assert [element["type"] for element in page["elements"]] == ["paragraph", "paragraph", "table"]
+    assert all(element["text"].startswith("The quick brown fox") for element in page["elements"][:2])
+    assert page["elements"][2]["rows"] == TABLE